@@ -0,0 +1 @@
+"""Benchmarks for portcran, run from the top of the source tree (e.g. `python3 -m benchmarks.make_expansion`)."""
@@ -0,0 +1,31 @@
+"""Benchmark reading deeply chained variables from a MakeDict."""
+from argparse import ArgumentParser
+from timeit import repeat
+from ports.core.make import MakeDict
+
+
+def chain(depth: int) -> MakeDict:
+    """Return a MakeDict where VAR0 = ${VAR1}, VAR1 = ${VAR2}, ... and VAR<depth> = value."""
+    variables = MakeDict()
+    for i in range(depth):
+        variables.set("VAR%d" % i, ["${VAR%d}" % (i + 1)])
+    variables.set("VAR%d" % depth, ["value"])
+    return variables
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Time repeated reads of the head of a chain of variable references")
+    parser.add_argument("-n", "--number", type=int, default=10000, help="reads per measurement")
+    parser.add_argument("depths", nargs="*", type=int, default=[1, 10, 100, 500], help="chain depths")
+    args = parser.parse_args()
+    print("%8s %14s %14s" % ("depth", "first (us)", "repeat (us)"))
+    for depth in args.depths:
+        variables = chain(depth)
+        first = min(repeat(lambda: chain(depth)["VAR0"], number=1, repeat=5)) - \
+            min(repeat(lambda: chain(depth), number=1, repeat=5))
+        again = min(repeat(lambda: variables["VAR0"], number=args.number, repeat=5)) / args.number
+        print("%8d %14.2f %14.2f" % (depth, first * 1e6, again * 1e6))
+
+
+if __name__ == "__main__":
+    main()
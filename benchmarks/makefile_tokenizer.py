@@ -0,0 +1,46 @@
+"""Benchmark splitting Makefiles into logical lines, and evaluating them, over a synthetic ports tree."""
+from argparse import ArgumentParser
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Iterator, List
+from ports.core.make import _logical_lines, make_vars
+from ports.utilities import Stream
+from .synthetic import generate
+
+
+def legacy_logical_lines(makefile: Path) -> Iterator[str]:
+    """The line based implementation that _logical_lines() replaced, kept for comparison."""
+    with open(makefile, "r") as source:
+        data = Stream(source, lambda x: x.split("#", 2)[0].rstrip(), line=0)
+        while True:
+            lines = list(data.take_while(lambda x: x.endswith("\\"), inclusive=True))
+            if not lines:
+                break
+            yield " ".join(line.rstrip("\\") for line in lines)
+
+
+def tokenize(makefile: Path) -> List[str]:
+    """Split the Makefile into logical lines, as _Makefile.include() does."""
+    with open(makefile, "r") as source:
+        return _logical_lines(source.read())
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Time tokenizing and evaluating the Makefiles of a synthetic ports tree")
+    parser.add_argument("-n", "--ports", type=int, default=30000, help="number of ports")
+    args = parser.parse_args()
+    with TemporaryDirectory() as root:
+        portdirs = generate(Path(root), args.ports)
+        makefiles = [i / "Makefile" for i in portdirs]
+        for name, function in (("legacy", lambda x: list(legacy_logical_lines(x))), ("tokenizer", tokenize),
+                               ("make_vars", lambda x: make_vars(x.parent))):
+            start = perf_counter()
+            for makefile in makefiles:
+                function(makefile)
+            elapsed = perf_counter() - start
+            print("%-10s %8.3f s %8.1f us/Makefile" % (name, elapsed, elapsed / len(makefiles) * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""Benchmark the memory used by the ports collection, using tracemalloc, over a synthetic ports tree."""
+from argparse import ArgumentParser
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from tracemalloc import get_traced_memory, start, stop
+from ports.core import Ports
+from ports.core.cache import Cache
+# imported to register the CranPort factory, so that the R-cran ports are loaded as CranPorts
+import ports.cran  # noqa: F401  # pylint: disable=unused-import
+from .synthetic import generate
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Measure the memory used by the stubs and loaded ports of a synthetic tree")
+    parser.add_argument("-n", "--ports", type=int, default=30000, help="number of ports")
+    args = parser.parse_args()
+    with TemporaryDirectory() as root:
+        generate(Path(root) / "ports", args.ports)
+        Ports.dir = Path(root) / "ports"
+        Cache.dir = Path(root) / "cache"
+        start()
+        stubs = Ports.get_stubs()
+        after_stubs, _ = get_traced_memory()
+        for stub in stubs:
+            Ports.get_port_by_origin(stub.origin)
+        after_load, _ = get_traced_memory()
+        stop()
+    print("%-8s %10.1f MiB %8d bytes/port" % ("stubs", after_stubs / 2 ** 20, after_stubs // len(stubs)))
+    print("%-8s %10.1f MiB %8d bytes/port" % ("loaded", after_load / 2 ** 20, after_load // len(stubs)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Benchmark the main operations of portcran over a synthetic ports tree and synthetic CRAN tarballs.
+
+The results are written as JSON (to standard output, or the file given by --output), along with the commit and the
+benchmark parameters, so that runs from different commits may be compared using --compare.
+"""
+from argparse import ArgumentParser, Namespace
+from json import dump, load
+from pathlib import Path
+from platform import python_version
+from statistics import mean, median
+from subprocess import CalledProcessError, check_output
+from sys import stdout
+from tempfile import TemporaryDirectory
+from time import perf_counter, time
+from typing import Any, Callable, Dict, List, Optional
+from ports.core import Ports
+from ports.core.cache import Cache
+from ports.cran import Cran, CranPort
+from ports.cran.port import CHANGELOGS
+from ports.cran.tarball import Tarball
+from .synthetic import generate, generate_tarball, portname
+
+
+def measure(func: Callable[[], None], repeat: int, ops: int = 1,
+            setup: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    """Time the function the specified number of times, returning statistics of the seconds taken per operation."""
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = perf_counter()
+        func()
+        samples.append((perf_counter() - start) / ops)
+    return {"ops": ops, "min": min(samples), "median": median(samples), "mean": mean(samples), "samples": samples}
+
+
+def commit() -> Optional[str]:
+    """Return the commit of the source tree being benchmarked (if known)."""
+    try:
+        return check_output(["git", "rev-parse", "HEAD"], cwd=str(Path(__file__).parent), text=True).strip()
+    except (CalledProcessError, OSError):
+        return None
+
+
+def run(args: Namespace, root: Path) -> Dict[str, Dict[str, Any]]:
+    # pylint: disable=protected-access,too-many-locals
+    """Generate the synthetic data under the root directory and run all benchmarks."""
+    results: Dict[str, Dict[str, Any]] = {}
+    portdirs = generate(root / "ports", args.ports, args.categories, fanout=args.fanout)
+    Ports.dir = root / "ports"
+    Ports.distdir = root / "distfiles"  # type: ignore
+    Cache.dir = root / "cache"
+    index = Cache("index", str(Ports.dir))
+
+    def cold() -> None:
+        Ports.reset()
+        if index.path.exists():
+            index.path.unlink()
+    results["load_ports.cold"] = measure(Ports.get_stubs, args.repeat, setup=cold)
+    results["load_ports.warm"] = measure(Ports.get_stubs, args.repeat, setup=Ports.reset)
+
+    stubs = Ports.get_stubs()
+    names = [i.name for i in stubs]
+    origins = [i.origin for i in stubs]
+    results["lookup.name"] = measure(lambda: [Ports.get_stub_by_name(i) for i in names], args.repeat, len(names))
+    results["lookup.origin"] = measure(lambda: [Ports.get_stub_by_origin(i) for i in origins], args.repeat,
+                                       len(origins))
+
+    sample = portdirs[::max(1, len(portdirs) // args.sample)]
+    prefix = len(Cran.PKGNAMEPREFIX)
+    results["port.load"] = measure(
+        lambda: [CranPort(i.parent.name, i.name[prefix:], i).load() for i in sample], args.repeat, len(sample))
+
+    tarballs = [generate_tarball(root / "distfiles", "bench%03d" % i, args.versions, args.size,
+                                 [portname(j) for j in range(i % 5)], seed=i) for i in range(args.tarballs)]
+    packages = [i.name.split("_")[0] for i in tarballs]
+    outputs = [root / "output" / i for i in packages]
+    ports: List[CranPort] = []
+
+    def create() -> None:
+        ports[:] = [CranPort.create(i, j, k) for i, j, k in zip(packages, tarballs, outputs)]
+    results["cranport.create"] = measure(create, args.repeat, len(tarballs))
+
+    archives = [Tarball(i, [], ["%s/%s" % (j, k) for k in CHANGELOGS]) for i, j in zip(tarballs, packages)]
+    try:
+        results["cranport.load_changelog"] = measure(
+            lambda: [i._load_changelog(j) for i, j in zip(ports, archives)], args.repeat, len(ports))
+    finally:
+        for archive in archives:
+            archive.close()
+
+    def clean() -> None:
+        for output in outputs:
+            if output.exists():
+                for path in output.iterdir():
+                    path.unlink()
+            output.mkdir(parents=True, exist_ok=True)
+    results["port.generate"] = measure(lambda: [i.generate() for i in ports], args.repeat, len(ports), clean)
+    results["port.regenerate"] = measure(lambda: [i.generate() for i in ports], args.repeat, len(ports))
+    return results
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> None:
+    """Print the median of each benchmark against the baseline results."""
+    print("%-26s %14s %14s %8s" % ("benchmark", "baseline (us)", "current (us)", "ratio"))
+    for name, result in current["results"].items():
+        if name in baseline["results"]:
+            old = baseline["results"][name]["median"]
+            new = result["median"]
+            print("%-26s %14.2f %14.2f %8.2f" % (name, old * 1e6, new * 1e6, new / old if old else float("inf")))
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Benchmark portcran over synthetic data")
+    parser.add_argument("-n", "--ports", type=int, default=30000, help="number of ports in the tree")
+    parser.add_argument("-c", "--categories", type=int, default=60, help="number of categories in the tree")
+    parser.add_argument("-f", "--fanout", type=int, default=4, help="maximum dependencies of a port")
+    parser.add_argument("-s", "--sample", type=int, default=1000, help="number of ports to load")
+    parser.add_argument("-t", "--tarballs", type=int, default=20, help="number of CRAN tarballs")
+    parser.add_argument("--size", type=int, default=1 << 20, help="size of the R sources in each tarball")
+    parser.add_argument("--versions", type=int, default=500, help="number of versions in each NEWS file")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="number of times to run each benchmark")
+    parser.add_argument("-o", "--output", help="write the results to the file")
+    parser.add_argument("--compare", help="compare the results with those in the file")
+    args = parser.parse_args()
+    with TemporaryDirectory() as root:
+        results = run(args, Path(root))
+    document = {
+        "commit": commit(),
+        "python": python_version(),
+        "timestamp": int(time()),
+        "parameters": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": results,
+    }
+    if args.output is not None:
+        with open(args.output, "w") as output:
+            dump(document, output, indent=2)
+    else:
+        dump(document, stdout, indent=2)
+        stdout.write("\n")
+    if args.compare is not None:
+        with open(args.compare) as baseline:
+            compare(load(baseline), document)
+
+
+if __name__ == "__main__":
+    main()
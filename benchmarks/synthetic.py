@@ -0,0 +1,182 @@
+"""Generate a synthetic ports tree, and synthetic CRAN package tarballs, for benchmarking."""
+from argparse import ArgumentParser
+from io import BytesIO
+from pathlib import Path
+from random import Random
+from tarfile import TarFile, TarInfo
+from typing import Iterable, List
+
+PORT_MAKEFILE = """\
+# Created by: Synthetic Porter <porter@example.org>
+# $FreeBSD$
+
+PORTNAME=	%(portname)s
+DISTVERSION=	%(version)s
+%(portrevision)sCATEGORIES=	%(category)s
+DISTNAME=	${PORTNAME}_${DISTVERSION}
+
+MAINTAINER=	porter@example.org
+COMMENT=	Synthetic package %(portname)s  # not a real package
+
+LICENSE=	%(license)s
+
+%(depends)sUSES=		cran:auto-plist%(compiles)s
+
+%(conditional)s.include <bsd.port.mk>
+"""
+
+CONDITIONAL = """\
+.if defined(WITH_DEBUG) && ${WITH_DEBUG:tl} == "yes"
+BROKEN=		debug builds \\
+		are not supported
+.else
+NO_ARCH=	yes
+.endif
+
+"""
+
+CATEGORY_MAKEFILE = """\
+# $FreeBSD$
+#
+
+    COMMENT = Synthetic category %(category)s
+
+%(subdirs)s
+.include <bsd.port.subdir.mk>
+"""
+
+DESCRIPTION = """\
+Package: %(name)s
+Version: %(version)s
+Title: Synthetic Package %(name)s
+Description: A synthetic package generated for benchmarking portcran, with a
+    description that spans more than one line.
+License: GPL-2
+URL: https://example.org/%(name)s
+Depends: R (>= 3.5.0)
+%(imports)sNeedsCompilation: no
+Packaged: 2018-10-24 12:00:00 UTC; porter
+Author: Synthetic Porter [aut, cre]
+Maintainer: Synthetic Porter <porter@example.org>
+Repository: CRAN
+Date/Publication: 2018-10-24 12:30:00 UTC
+"""
+
+LICENSES = ["GPLv2", "GPLv2+", "GPLv3", "MIT", "CC0-1.0"]
+
+WORDS = ["the", "function", "value", "argument", "data", "frame", "model", "now", "returns", "fixed", "when", "is",
+         "NA", "matrix", "vector", "list", "option", "default", "error", "warning", "documentation", "package"]
+
+
+def portname(index: int) -> str:
+    """Return the (CRAN) name of the synthetic package with the specified index."""
+    return "pkg%05d" % index
+
+
+def generate(root: Path, ports: int = 30000, categories: int = 60, seed: int = 0, fanout: int = 4) -> List[Path]:
+    """
+    Generate a ports tree with the specified number of R-cran ports spread over a number of categories.
+
+    The ports resemble those created by portcran: most with dependencies (up to fanout) on other synthetic ports, split
+    over continuation lines and skewed towards a few popular ports, some with a PORTREVISION and some with
+    conditionals.  Returns the paths of the port directories.
+    """
+    random = Random(seed)
+    names = ["cat%02d" % i for i in range(categories)]
+    subdirs: List[List[str]] = [[] for _ in names]
+    portdirs = []
+    category_of: List[int] = []
+    for index in range(ports):
+        category = random.randrange(categories)
+        category_of.append(category)
+        name = "R-cran-" + portname(index)
+        subdirs[category].append(name)
+        depends = sorted({int(index * random.random() ** 3) for _ in range(random.randint(0, fanout))}) if index else []
+        origins = ["R-cran-%s>0:%s/R-cran-%s" % (portname(i), names[category_of[i]], portname(i)) for i in depends]
+        portdir = root / names[category] / name
+        portdir.mkdir(parents=True, exist_ok=True)
+        (portdir / "Makefile").write_text(PORT_MAKEFILE % {
+            "portname": portname(index),
+            "version": "%d.%d-%d" % (random.randint(0, 9), random.randint(0, 20), random.randint(0, 99)),
+            "portrevision": "PORTREVISION=	%d\n" % random.randint(1, 5) if random.random() < 0.2 else "",
+            "category": names[category],
+            "license": random.choice(LICENSES),
+            "depends": "RUN_DEPENDS=	%s\n\n" % " \\\n\t\t".join(origins) if origins else "",
+            "compiles": ",compiles" if random.random() < 0.3 else "",
+            "conditional": CONDITIONAL if random.random() < 0.1 else "",
+        })
+        (portdir / "pkg-descr").write_text("Synthetic package %s.\n\nWWW: https://example.org/%s\n" % (name, name))
+        portdirs.append(portdir)
+    for name, ports_in_category in zip(names, subdirs):
+        (root / name).mkdir(parents=True, exist_ok=True)
+        (root / name / "Makefile").write_text(CATEGORY_MAKEFILE % {
+            "category": name,
+            "subdirs": "".join("    SUBDIR += %s\n" % i for i in sorted(ports_in_category)),
+        })
+    (root / "Mk").mkdir(exist_ok=True)
+    (root / "Mk" / "bsd.port.mk").write_text("# $FreeBSD$\n")
+    (root / "Makefile").write_text("".join("SUBDIR += %s\n" % i for i in names))
+    return portdirs
+
+
+def _sentence(random: Random, length: int) -> str:
+    return " ".join(random.choice(WORDS) for _ in range(length))
+
+
+def _add_member(tar_file: TarFile, name: str, data: str) -> None:
+    info = TarInfo(name)
+    content = data.encode("utf-8")
+    info.size = len(content)
+    info.mtime = 1540382400
+    tar_file.addfile(info, BytesIO(content))
+
+
+def generate_tarball(directory: Path, name: str, versions: int = 100, size: int = 1 << 20,
+                     imports: Iterable[str] = (), seed: int = 0) -> Path:
+    """
+    Generate a CRAN package tarball, returning its path.
+
+    The package is at version "<versions>.0" and its NEWS file has a section for each of the versions (newest first).
+    The R sources are padded to roughly the specified (uncompressed) size.  As R does, the members are stored in sorted
+    order.
+    """
+    random = Random(seed)
+    version = "%d.0" % versions
+    news = []
+    for i in range(versions, 0, -1):
+        news.append("Changes to Version %d.0\n" % i)
+        news.extend("  * %s\n" % _sentence(random, random.randint(5, 30)) for _ in range(random.randint(1, 8)))
+        news.append("\n")
+    sources = []
+    remaining = size
+    while remaining > 0:
+        source = "".join("%s <- function(x) { %s }\n" % (random.choice(WORDS), _sentence(random, 12))
+                         for _ in range(1000))
+        sources.append(source)
+        remaining -= len(source)
+    directory.mkdir(parents=True, exist_ok=True)
+    tarball = directory / ("%s_%s.tar.gz" % (name, version))
+    with TarFile.open(str(tarball), "w:gz") as tar_file:
+        _add_member(tar_file, "%s/DESCRIPTION" % name, DESCRIPTION % {
+            "name": name, "version": version, "imports": "Imports: %s\n" % ", ".join(imports) if imports else "",
+        })
+        _add_member(tar_file, "%s/NAMESPACE" % name, "exportPattern(\"^[[:alpha:]]+\")\n")
+        _add_member(tar_file, "%s/NEWS" % name, "".join(news))
+        for i, source in enumerate(sources):
+            _add_member(tar_file, "%s/R/source%03d.R" % (name, i), source)
+    return tarball
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Generate a synthetic ports tree")
+    parser.add_argument("-n", "--ports", type=int, default=30000, help="number of ports")
+    parser.add_argument("-c", "--categories", type=int, default=60, help="number of categories")
+    parser.add_argument("-f", "--fanout", type=int, default=4, help="maximum dependencies of a port")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("root", help="directory of the ports tree")
+    args = parser.parse_args()
+    generate(Path(args.root), args.ports, args.categories, args.seed, args.fanout)
+
+
+if __name__ == "__main__":
+    main()
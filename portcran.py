@@ -1,12 +1,20 @@
 #!/usr/bin/env python3
 from argparse import ArgumentParser, Namespace
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
-from re import search
 from sys import argv
-from typing import Callable, Iterable, List, Optional, TextIO, Tuple
-from urllib.request import urlopen, urlretrieve
+from traceback import print_exc
+from typing import Any, Callable, Dict, Iterable, List, Optional, TextIO, Tuple, TypeVar
 from ports import Platform, PortError, PortLicense, Ports
-from ports.cran import Cran, CranPort
+from ports.core import PortStub, daemon
+from ports.core.fetch import Checksums, fetch, fetch_all
+from ports.core.make import make_vars
+from ports.core.metrics import Metrics
+from ports.core.trace import Trace, traced
+from ports.cran import Cran, CranPort, Packages
+from ports.cran.packages import CONTRIB_URL
+from ports.cran.port import INTERNAL_PACKAGES
 
 
 __author__ = "David Naylor <dbn@FreeBSD.org>"
@@ -19,19 +27,33 @@ ERR_GENERAL = 1
 ERR_CATEGORY = 2
 ERR_EXISTS = 3
 
+T = TypeVar("T")  # pylint: disable=C0103
+
 
 class Command(object):
     def __init__(self, description: str) -> None:
         self._parser = ArgumentParser(description=description)
-        self._subparsers = self._parser.add_subparsers(title="available sub-commands", help="sub-command help")
+        self._subparsers = self._parser.add_subparsers(title="available sub-commands", help="sub-command help",
+                                                       dest="verb")
+        self._configure: Callable[[Namespace], None] = lambda args: None
 
     def execute(self, args: List[str]) -> None:
         parsed_args = self._parser.parse_args(args)
+        self._configure(parsed_args)
         if hasattr(parsed_args, "action"):
             parsed_args.action(parsed_args)
         else:
             self.usage()
 
+    def verb(self, args: List[str]) -> Optional[str]:
+        """Return the sub-command of the arguments (if any), skipping the options and their values."""
+        verb: Optional[str] = self._parser.parse_known_args(args)[0].verb
+        return verb
+
+    def options(self, configure: Callable[[Namespace], None]) -> ArgumentParser:
+        self._configure = configure
+        return self._parser
+
     def usage(self) -> None:
         self._parser.print_usage()
 
@@ -43,20 +65,62 @@ class Command(object):
         return decorator
 
 
-def make_cran_port(name: str, portdir: Optional[Path] = None, version: Optional[str] = None) -> CranPort:
+def cran_version(name: str) -> str:
+    return Packages.get(name).version
+
+
+def cran_distfile(name: str, version: Optional[str] = None) -> Tuple[str, Path, Optional[str]]:
+    package = Packages.get(name)
     if not version:
-        print("Checking for latest version...")
-        site_page = urlopen("http://cran.r-project.org/package=%s" % name).read().decode("utf-8")
-        version_match = search(r"<td>Version:</td>\s*<td>(.*?)</td>", str(site_page))
-        assert version_match is not None
-        version = version_match.group(1)
+        version = package.version
     distfile = Ports.distdir / ("%s_%s.tar.gz" % (name, version))
-    if not distfile.exists():  # pylint: disable=no-member
-        print("Fetching package source (%s-%s)..." % (name, version))
-        urlretrieve("https://cran.r-project.org/src/contrib/%s" % distfile.name, distfile)  # pylint: disable=no-member
+    if version == package.version:
+        return "%s/%s" % (CONTRIB_URL, distfile.name), distfile, package.md5sum
+    return "%s/Archive/%s/%s" % (CONTRIB_URL, name, distfile.name), distfile, None
+
+
+def make_cran_port(name: str, portdir: Optional[Path] = None, version: Optional[str] = None) -> CranPort:
+    distfile = fetch(*cran_distfile(name, version))
     return CranPort.create(name, distfile, portdir)
 
 
+def has_cran_port(name: str) -> bool:
+    try:
+        Ports.get_stub_by_name(Cran.PKGNAMEPREFIX + name)
+    except PortError:
+        return False
+    return True
+
+
+def missing_dependencies(name: str) -> List[List[str]]:
+    """
+    Return the CRAN package, and the packages it requires that do not have a port, in dependency order.
+
+    The packages are grouped into levels, where a package only requires packages from the earlier levels (so packages in
+    the same level are independent of each other).  The specified package is the only package in the last level.
+    """
+    levels: Dict[str, int] = {}
+    path: List[str] = []
+
+    def visit(package: str) -> int:
+        if package in path:
+            raise PortError("CRAN: dependency cycle: %s" % " -> ".join(path[path.index(package):] + [package]))
+        if package not in levels:
+            path.append(package)
+            level = 0
+            for require in Packages.get(package).requires:
+                if require not in INTERNAL_PACKAGES and not has_cran_port(require):
+                    level = max(level, visit(require) + 1)
+            path.pop()
+            levels[package] = level
+        return levels[package]
+
+    ordered: List[List[str]] = [[] for _ in range(visit(name) + 1)]
+    for package, level in sorted(levels.items()):
+        ordered[level].append(package)
+    return ordered
+
+
 def diff(left: Iterable[str], right: Iterable[str]) -> Tuple[List[str], bool, List[str]]:
     left = list(left)
     right = list(right)
@@ -146,9 +210,14 @@ def generate_update_log(old: CranPort, new: CranPort) -> None:
 
         if new.version in new.changelog:
             assert old.portname is not None
-            port = make_cran_port(old.portname, version=old.version)
-            assert port.version == old.version
-            if port.version in port.changelog and port.changelog[port.version] == new.changelog[new.version]:
+            cached = CranPort.cached(old.portname, old.version)
+            if "changelog" in cached:
+                changelog = cached["changelog"]
+            else:
+                port = make_cran_port(old.portname, version=old.version)
+                assert port.version == old.version
+                changelog = port.changelog
+            if old.version in changelog and changelog[old.version] == new.changelog[new.version]:
                 log.write(" - changelog not updated\n")
             else:
                 log.write(" - changelog:\n")
@@ -168,86 +237,315 @@ def generate_update_log(old: CranPort, new: CranPort) -> None:
         log.write("\nGenerated by:\tportcran (%s)\n" % __version__)
 
 
-def update_category(portsdir: Path, category: str, name: str) -> None:
-    entry = "    SUBDIR += %s\n" % name
+def update_category(portsdir: Path, category: str, *names: str) -> None:
+    entries = sorted("    SUBDIR += %s\n" % name for name in names)
     makefile = portsdir / category / "Makefile"
     tmpfile = portsdir / category / ".Makefile.portcran"
     with makefile.open() as old:
         with tmpfile.open("w") as new:
             has_subdir = False
-            drain = False
             for line in old.readlines():
-                if not drain:
-                    if line == entry:
-                        drain = True
+                if entries:
                     if line.lstrip().startswith("SUBDIR"):
                         has_subdir = True
-                        if line > entry:
-                            new.write(entry)
-                            drain = True
+                        while entries and entries[0] <= line:
+                            entry = entries.pop(0)
+                            if entry != line:
+                                new.write(entry)
                     elif has_subdir:
-                        new.write(entry)
-                        drain = True
+                        new.writelines(entries)
+                        entries = []
                 new.write(line)
+            if has_subdir:
+                new.writelines(entries)
     tmpfile.rename(makefile)
 
 
-def generate_create_log(cran: CranPort) -> None:
-    with open(cran.portdir / ".." / ".." / "commit.svn", "w") as log:
-        log.write("%s: %s\n" % (cran.origin, cran.comment))
+@traced("portcran")
+def update_port(name: str, output: Optional[str] = None) -> str:
+    port = Ports.get_port_by_name(Cran.PKGNAMEPREFIX + name)
+    assert isinstance(port, CranPort)
+    version = cran_version(name)
+    if version == port.version:
+        return "already at version %s" % version
+    cran = make_cran_port(name, portdir=port.portdir if output is None else Path(output), version=version)
+    with Trace.span("generate", "portcran", origin=cran.origin):
+        cran.generate()
+    with Trace.span("generate_update_log", "portcran", origin=cran.origin):
+        generate_update_log(port, cran)
+    return "updated to version %s (see %s)" % (cran.version, cran.portdir / "commit.svn")
+
+
+def port_version(port: PortStub) -> str:
+    """Return the version of the port, evaluating its Makefile unless the port is already loaded."""
+    if isinstance(port, CranPort):
+        return port.version
+    variables = make_vars(port.portdir)
+    return " ".join(variables["DISTVERSION" if "DISTVERSION" in variables else "PORTVERSION"])
+
+
+def outdated_ports() -> List[str]:
+    """
+    Return the names of the CRAN packages whose port is not at the version in the CRAN index.
+
+    A port that is not in the CRAN index, or whose Makefile cannot be evaluated, is included so that updating it
+    reports the failure.
+    """
+    Packages.load()
+    names = []
+    for port in Ports.get_stubs():
+        if port.name.startswith(Cran.PKGNAMEPREFIX):
+            name = port.name[len(Cran.PKGNAMEPREFIX):]
+            try:
+                if port_version(port) == cran_version(name):
+                    continue
+            except (OSError, ValueError, PortError):
+                pass
+            names.append(name)
+    return names
+
+
+def update_port_job(name: str) -> Tuple[str, bool, str]:
+    try:
+        return name, True, update_port(name)
+    except Exception as ex:  # pylint: disable=broad-except
+        return name, False, "%s: %s" % (type(ex).__name__, ex)
+
+
+def collect_job(job: Callable[..., T], *args: Any) -> Tuple[T, List[Dict[str, Any]], Dict[str, Dict[str, int]]]:
+    """Run a job in a worker process, returning its result along with the trace events and counters it recorded."""
+    Trace.drain()  # discard the events and counters inherited from the parent process
+    Metrics.drain()
+    result = job(*args)
+    return result, Trace.drain(), Metrics.drain()
+
+
+def run_jobs(job: Callable[..., T], *iterables: Iterable[Any]) -> List[T]:
+    """Run the job over the arguments using up to Ports.workers processes, collecting each job's trace and counters."""
+    results = []
+    with ProcessPoolExecutor(max_workers=Ports.workers) as executor:
+        for result, events, counters in executor.map(collect_job, repeat(job), *iterables):
+            Trace.extend(events)
+            Metrics.merge(counters)
+            results.append(result)
+    return results
+
+
+def update_ports(names: List[str]) -> bool:
+    # load the ports collection and CRAN index before forking the workers
+    Ports.get_stubs()
+    Packages.load()
+    failed = []
+    results = run_jobs(update_port_job, names)
+    print("Summary:")
+    for name, success, message in results:
+        print("\t%s: %s" % (name, message))
+        if not success:
+            failed.append(name)
+    print("%d succeeded, %d failed" % (len(results) - len(failed), len(failed)))
+    return not failed
+
+
+@traced("portcran")
+def create_port(name: str, categories: List[str], portsdir: Path) -> CranPort:
+    portdir = portsdir / categories[0] / (Cran.PKGNAMEPREFIX + name)
+    cran = make_cran_port(name, portdir)
+    cran.categories = categories
+    cran.maintainer = Platform.address
+    portdir.mkdir()
+    with Trace.span("generate", "portcran", origin=cran.origin):
+        cran.generate()
+    return cran
+
+
+def create_port_job(name: str, categories: List[str], portsdir: Path) -> Tuple[str, bool, str]:
+    try:
+        return name, True, create_port(name, categories, portsdir).comment or ""
+    except Exception as ex:  # pylint: disable=broad-except
+        return name, False, "%s: %s" % (type(ex).__name__, ex)
+
+
+def create_ports(name: str, categories: List[str], portsdir: Path) -> bool:
+    """
+    Create the port for a CRAN package along with the ports for all of its missing dependencies.
+
+    All distfiles are fetched (and hashed) up front, then the ports are generated one level of the dependency order at a
+    time (with the ports in a level generated concurrently).  The category Makefile is updated once all ports have been
+    created.
+    """
+    with Trace.span("missing_dependencies", "portcran", package=name):
+        levels = missing_dependencies(name)
+    with Trace.span("fetch_all", "network"):
+        distfiles = fetch_all((cran_distfile(i) for level in levels for i in level), Ports.workers)
+    for distfile, error in distfiles:
+        if error is not None:
+            raise PortError("Fetch: unable to fetch %s: %s" % (distfile.name, error))
+    with Trace.span("digest_all", "portcran"):
+        Checksums.digest_all((i for i, _ in distfiles), "sha256", Ports.workers)
+    category = categories[0]
+    created: List[Tuple[str, str]] = []
+    failed = []
+    for level in levels:
+        with Trace.span("create_level", "portcran", ports=len(level)):
+            results = run_jobs(create_port_job, level, repeat(categories), repeat(portsdir))
+        for package, success, message in results:
+            if success:
+                portname = Cran.PKGNAMEPREFIX + package
+                port = PortStub(category, portname, portsdir / category / portname)
+                Ports.add_port(port)
+                created.append((port.origin, message))
+                print("\t%s: created" % port.origin)
+            else:
+                failed.append(package)
+                print("\t%s: %s" % (package, message))
+        if failed:
+            break
+    if created:
+        update_category(portsdir, category, *(origin.split("/", 1)[1] for origin, _ in created))
+    if failed:
+        print("%d created, %d failed" % (len(created), len(failed)))
+        return False
+    generate_create_log(portsdir, created)
+    return True
+
+
+def generate_create_log(portsdir: Path, created: List[Tuple[str, str]]) -> None:
+    """Write the commit log for the created (origin, comment) ports, where the last port is the requested port."""
+    origin, comment = created[-1]
+    with open(portsdir / "commit.svn", "w") as log:
+        log.write("%s: %s\n" % (origin, comment))
+        if len(created) > 1:
+            log.write("\n - new dependenc%s:\n" % yies(created[:-1]))
+            for origin, comment in created[:-1]:
+                log.write("   - %s: %s\n" % (origin, comment))
         log.write("\nGenerated by:\tportcran (%s)\n" % __version__)
 
 
-def main() -> None:
+def commands() -> Command:
     command = Command(__summary__)
 
-    @command("update", "update a CRAN port")
+    @command.options
+    def options(args: Namespace) -> None:
+        Ports.progress = args.verbose
+        if args.jobs is not None:
+            Ports.workers = args.jobs
+        if args.profile is not None:
+            Trace.start(Path(args.profile))
+        if args.stats is not None:
+            Metrics.start(args.stats, Path(args.stats_file) if args.stats_file is not None else None)
+    options.add_argument("-j", "--jobs", type=int, help="number of concurrent jobs")
+    options.add_argument("--profile", metavar="FILE", help="write a Chrome trace of where time is spent to FILE")
+    options.add_argument("--stats", choices=("json", "prometheus"), help="report counters of the work done at exit")
+    options.add_argument("--stats-file", metavar="FILE", help="write the --stats report to FILE instead of stdout")
+    options.add_argument("-v", "--verbose", action="store_true", help="report progress")
+
+    @command("update", "update CRAN ports")
     def update(args: Namespace) -> None:
-        port = Ports.get_port_by_name(Cran.PKGNAMEPREFIX + args.name)
-        assert isinstance(port, CranPort)
-        cran = make_cran_port(args.name, portdir=Path(args.output))
-        cran.generate()
-        generate_update_log(port, cran)
-    update.add_argument("name", help="name of the CRAN package")
+        if len(args.names) == 1:
+            print(update_port(args.names[0], args.output))
+            return
+        if args.output is not None:
+            print("err: --output can only be used when updating a single port")
+            exit(ERR_GENERAL)
+        if not update_ports(args.names):
+            exit(ERR_GENERAL)
+    update.add_argument("names", nargs="+", metavar="name", help="name of the CRAN package")
     update.add_argument("-o", "--output", help="output directory")
 
+    @command("update-all", "update all outdated CRAN ports")
+    def update_all(args: Namespace) -> None:
+        # pylint: disable=unused-argument
+        names = outdated_ports()
+        if not names:
+            print("All CRAN ports are up to date")
+            return
+        if not update_ports(names):
+            exit(ERR_GENERAL)
+
+    @command("rdeps", "list the ports that depend on a CRAN port")
+    def rdeps(args: Namespace) -> None:
+        port = Ports.get_stub_by_name(Cran.PKGNAMEPREFIX + args.name)
+        for origin in Ports.get_reverse_depends(port.origin):
+            print(origin)
+    rdeps.add_argument("name", help="name of the CRAN package")
+
     @command("create", "create a CRAN port")
     def create(args: Namespace) -> None:
         if args.address is not None:
             Platform.address = args.address
         categories = args.categories.split(",")
         for category in categories:
-            if category not in Ports.categories:
+            if category not in Ports.categories:  # pylint: disable=unsupported-membership-test  # a LazyAttribute
                 print("err: %s in not a ports category" % category)
                 exit(ERR_CATEGORY)
         portsdir = Ports.dir if args.portsdir is None else Path(args.portsdir)
-        category = categories[0]
-        name = Cran.PKGNAMEPREFIX + args.name
-        portdir = portsdir / category / name
-        cran = make_cran_port(args.name, portdir)
-        cran.categories = categories
-        cran.maintainer = Platform.address
         try:
-            port = Ports.get_port_by_name(name)
+            port = Ports.get_stub_by_name(Cran.PKGNAMEPREFIX + args.name)
             print("err: CRAN port %s already exists at %s" % (args.name, port.origin))
             exit(ERR_EXISTS)
         except PortError:
             pass
-        portdir.mkdir()
-        update_category(portsdir, category, name)
-        cran.generate()
-        generate_create_log(cran)
+        if args.recursive:
+            if not create_ports(args.name, categories, portsdir):
+                exit(ERR_GENERAL)
+            return
+        cran = create_port(args.name, categories, portsdir)
+        update_category(portsdir, categories[0], cran.name)
+        generate_create_log(portsdir, [(cran.origin, cran.comment or "")])
     create.add_argument("name", help="name of the CRAN package")
+    create.add_argument("-r", "--recursive", action="store_true", help="also create ports for missing dependencies")
     create.add_argument("-a", "--address", help="creator's email address")
     create.add_argument("-c", "--categories", default="math", help="comma separated list of the CRAN port's categories")
     create.add_argument("-p", "--portsdir", help="output ports directory")
 
-    command.execute(argv[1:])
+    @command("serve", "run the commands of clients, keeping the ports collection loaded")
+    def serve(args: Namespace) -> None:
+        Ports.get_stubs()
+        defaults = Ports.progress, Ports.workers, Platform.address
+
+        def serve_command(command_args: List[str]) -> int:
+            Ports.progress, Ports.workers, Platform.address = defaults
+            Ports.refresh()
+            Packages.refresh()
+            Checksums.reset()
+            Trace.drain()
+            Metrics.drain()
+            try:
+                return run(command_args)
+            except Exception:  # pylint: disable=broad-except
+                print_exc()
+                return ERR_GENERAL
+        daemon.serve(daemon.socket_path(Ports.dir) if args.socket is None else Path(args.socket), serve_command)
+    serve.add_argument("-s", "--socket", help="path of the socket to listen on")
+
+    return command
+
+
+def main(args: List[str]) -> None:
+    command = commands()
+    try:
+        command.execute(args)
+    finally:
+        Trace.finish()
+        Metrics.finish()
 
 
-if __name__ == "__main__":
+def run(args: List[str]) -> int:
+    """Run portcran with the specified arguments, returning the exit status."""
     try:
-        main()
+        main(args)
     except PortError as ex:
         print("err: %s" % ex)
-        exit(ERR_GENERAL)
+        return ERR_GENERAL
+    except SystemExit as ex:
+        if ex.code is None or isinstance(ex.code, int):
+            return ex.code or 0
+        print(ex.code)
+        return ERR_GENERAL
+    return 0
+
+
+if __name__ == "__main__":
+    # use a running server, unless this is the server
+    STATUS = None if commands().verb(argv[1:]) == "serve" else daemon.request(daemon.socket_path(Ports.dir), argv[1:])
+    exit(run(argv[1:]) if STATUS is None else STATUS)
@@ -0,0 +1,95 @@
+"""Persistent on-disk caches shared between invocations of portcran."""
+from contextlib import contextmanager
+from fcntl import LOCK_EX, flock
+from hashlib import sha1
+from json import dump, load
+from os import O_CREAT, O_RDWR, close, environ, getpid, open as os_open
+from pathlib import Path
+from threading import get_ident
+from typing import Any, ClassVar, Dict, Iterator, Optional
+
+__all__ = ["Cache"]
+
+CACHE_VERSION = 1
+
+
+def _cache_dir() -> Path:
+    if "PORTCRAN_CACHE" in environ:
+        return Path(environ["PORTCRAN_CACHE"])
+    return Path(environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "portcran"
+
+
+class Cache:
+    """
+    A JSON document stored in the portcran cache directory.
+
+    The cache directory defaults to ${XDG_CACHE_HOME}/portcran and may be overridden using the PORTCRAN_CACHE
+    environment variable.  A cache is purely an optimisation: a missing, corrupt or stale document loads as empty and
+    failures to save are silently ignored.
+    """
+
+    dir: ClassVar[Path] = _cache_dir()
+
+    def __init__(self, name: str, key: Optional[str] = None) -> None:
+        """
+        Initialise a new cache with the specified name.
+
+        If a key is specified (such as the path of the ports tree) then the document is specific to that key.
+        """
+        self.name = name
+        self.key = key
+
+    @property
+    def path(self) -> Path:
+        """The path of the cache document."""
+        if self.key is None:
+            return Cache.dir / ("%s.json" % self.name)
+        return Cache.dir / ("%s-%s.json" % (self.name, sha1(self.key.encode("utf-8")).hexdigest()[:12]))
+
+    def load(self) -> Dict[str, Any]:
+        """Load the cached document, returning an empty document if none (valid) exists."""
+        try:
+            with self.path.open("r", encoding="utf-8") as cache:
+                document = load(cache)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(document, dict) or document.get("version") != CACHE_VERSION or \
+                document.get("key") != self.key:
+            return {}
+        data = document.get("data")
+        return data if isinstance(data, dict) else {}
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """
+        Hold an exclusive lock on the cached document, across processes.
+
+        This allows a process to load, merge into and save the document without losing the changes saved by other
+        processes in the meantime.  If the lock cannot be created the document is not locked.
+        """
+        lockfile = self.path.with_name(self.path.name + ".lock")
+        try:
+            lockfile.parent.mkdir(parents=True, exist_ok=True)
+            descriptor: Optional[int] = os_open(str(lockfile), O_RDWR | O_CREAT, 0o644)
+        except OSError:
+            descriptor = None
+        try:
+            if descriptor is not None:
+                flock(descriptor, LOCK_EX)
+            yield
+        finally:
+            if descriptor is not None:
+                close(descriptor)
+
+    def save(self, data: Dict[str, Any]) -> None:
+        """Atomically replace the cached document with the specified data."""
+        path = self.path
+        tmpfile = path.with_name(".%s.%d.%d" % (path.name, getpid(), get_ident()))
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with tmpfile.open("w", encoding="utf-8") as cache:
+                dump({"version": CACHE_VERSION, "key": self.key, "data": data}, cache)
+            tmpfile.rename(path)
+        except OSError:
+            if tmpfile.exists():
+                tmpfile.unlink()
@@ -0,0 +1,124 @@
+"""A long running server, and its client, that run portcran commands over a Unix socket."""
+from hashlib import sha1
+from json import dumps, loads
+from os import chdir, close, dup, dup2, environ, getcwd
+from pathlib import Path
+from signal import SIGTERM, signal
+from socket import AF_UNIX, SHUT_RDWR, SHUT_WR, SOCK_STREAM, socket
+from sys import exit as sys_exit, stderr, stdout
+from tempfile import TemporaryFile
+from typing import Any, Callable, Dict, List, Optional, Tuple, cast
+from .cache import Cache
+from .port import PortError
+
+__all__ = ["request", "serve", "socket_path"]
+
+
+def socket_path(portsdir: Path) -> Path:
+    """
+    Return the path of the socket of the server for the specified ports tree.
+
+    The path may be overridden using the PORTCRAN_SOCKET environment variable, otherwise it is in the cache directory
+    and specific to the ports tree, so that a client only uses a server for the same ports tree.
+    """
+    if environ.get("PORTCRAN_SOCKET"):
+        return Path(environ["PORTCRAN_SOCKET"])
+    return Cache.dir / ("daemon-%s.sock" % sha1(str(portsdir).encode("utf-8")).hexdigest()[:12])
+
+
+def _receive(connection: socket) -> Dict[str, Any]:
+    chunks = []
+    for chunk in iter(lambda: connection.recv(1 << 16), b""):
+        chunks.append(chunk)
+    return cast(Dict[str, Any], loads(b"".join(chunks).decode("utf-8")))
+
+
+def _connect(path: Path) -> Optional[socket]:
+    client = socket(AF_UNIX, SOCK_STREAM)
+    try:
+        client.connect(str(path))
+    except OSError:
+        client.close()
+        return None
+    return client
+
+
+def request(path: Path, args: List[str]) -> Optional[int]:
+    """
+    Run the command (with arguments) using the server listening at the specified path, if any.
+
+    The command is run in the current directory and its output is written to stdout and stderr.  Returns the exit
+    status of the command, or None if no server is listening.
+    """
+    client = _connect(path)
+    if client is None:
+        return None
+    with client:
+        client.sendall(dumps({"args": args, "cwd": getcwd()}).encode("utf-8"))
+        client.shutdown(SHUT_WR)
+        response = _receive(client)
+    stdout.write(response["stdout"])
+    stderr.write(response["stderr"])
+    return int(response["status"])
+
+
+def _capture(command: Callable[[List[str]], int], args: List[str]) -> Tuple[int, str, str]:
+    """Run the command, capturing the output written to stdout and stderr (including by subprocesses)."""
+    with TemporaryFile() as out, TemporaryFile() as err:
+        stdout.flush()
+        stderr.flush()
+        saved = dup(1), dup(2)
+        dup2(out.fileno(), 1)
+        dup2(err.fileno(), 2)
+        try:
+            status = command(args)
+        finally:
+            stdout.flush()
+            stderr.flush()
+            dup2(saved[0], 1)
+            dup2(saved[1], 2)
+            close(saved[0])
+            close(saved[1])
+        out.seek(0)
+        err.seek(0)
+        return status, out.read().decode("utf-8", "replace"), err.read().decode("utf-8", "replace")
+
+
+def serve(path: Path, command: Callable[[List[str]], int]) -> None:
+    """
+    Listen at the specified path, running the command for each request until interrupted.
+
+    Requests are handled one at a time, in the client's current directory.  The command is passed the arguments and
+    must return the exit status, which is sent to the client along with the command's output.  The socket is removed
+    on exit (including on SIGTERM).
+    """
+    client = _connect(path)
+    if client is not None:
+        client.close()
+        raise PortError("Daemon: already listening at %s" % path)
+    if path.exists():
+        path.unlink()  # left by a server that did not exit cleanly
+    path.parent.mkdir(parents=True, exist_ok=True)
+    cwd = getcwd()
+    with socket(AF_UNIX, SOCK_STREAM) as server:
+        server.bind(str(path))
+        signal(SIGTERM, lambda signum, frame: sys_exit(0))
+        try:
+            server.listen()
+            print("Listening on %s" % path, flush=True)
+            while True:
+                connection, _ = server.accept()
+                with connection:
+                    try:
+                        message = _receive(connection)
+                        chdir(message["cwd"])
+                        status, out, err = _capture(command, message["args"])
+                        response = {"status": status, "stdout": out, "stderr": err}
+                        connection.sendall(dumps(response).encode("utf-8"))
+                        connection.shutdown(SHUT_RDWR)
+                    except (OSError, ValueError, KeyError) as ex:
+                        print("Daemon: failed request: %s" % ex, file=stderr)
+                    finally:
+                        chdir(cwd)
+        finally:
+            path.unlink()
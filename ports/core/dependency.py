@@ -1,5 +1,6 @@
 """Dependency architecture for a Port."""
 from abc import ABCMeta, abstractmethod
+from sys import intern
 from typing import Callable, ClassVar, List, Optional
 from ..utilities import Orderable
 
@@ -9,11 +10,13 @@ __all__ = ["Dependency"]
 class Dependency(Orderable, metaclass=ABCMeta):
     """Base class for objects representing a dependency to a Port."""
 
+    __slots__ = ("origin",)
+
     _factories: ClassVar[List[Callable[[str, str], Optional["Dependency"]]]] = []
 
     def __init__(self, origin: str) -> None:
         """Initialise the dependency with the specified port origin."""
-        self.origin = origin
+        self.origin = intern(origin)
 
     @abstractmethod
     def __str__(self) -> str:
@@ -0,0 +1,180 @@
+"""Fetching and verification of distfiles."""
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import new as new_hash
+from http.client import HTTPResponse
+from pathlib import Path
+from threading import Lock
+from typing import Any, ClassVar, Dict, Iterable, List, Optional, Tuple, cast
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+from .cache import Cache
+from .metrics import Metrics
+from .port import PortError
+from .trace import Trace
+
+__all__ = ["Checksums", "fetch", "fetch_all"]
+
+CHUNK_SIZE = 1 << 16
+
+DIGESTS = ("md5", "sha256")
+
+
+class Checksums:
+    """
+    A record of the checksums of distfiles.
+
+    A checksum is recorded against a file's size and modification time, so that a file that has not changed since it
+    was last hashed does not need to be read again.
+    """
+
+    _cache: ClassVar[Cache] = Cache("distfiles")
+    _lock: ClassVar[Lock] = Lock()
+    _records: ClassVar[Optional[Dict[str, Dict[str, Any]]]] = None
+
+    @staticmethod
+    def _get_records() -> Dict[str, Dict[str, Any]]:
+        if Checksums._records is None:
+            Checksums._records = Checksums._cache.load()
+        return Checksums._records
+
+    @staticmethod
+    def digest(path: Path, algorithm: str = "md5") -> str:
+        """Return the hex digest of the specified file, hashing the file only if no valid checksum is recorded."""
+        checksum = Checksums.recorded(path, algorithm)
+        Metrics.hit("distfiles", checksum is not None)
+        if checksum is None:
+            hasher = new_hash(algorithm)
+            with path.open("rb") as distfile:
+                for chunk in iter(lambda: distfile.read(CHUNK_SIZE), b""):
+                    hasher.update(chunk)
+            checksum = hasher.hexdigest()
+            Checksums.record(path, {algorithm: checksum})
+        return checksum
+
+    @staticmethod
+    def digest_all(paths: Iterable[Path], algorithm: str = "md5", workers: Optional[int] = None) -> List[str]:
+        """
+        Return the hex digests of the specified files (in the order given), hashing the files concurrently.
+
+        Hashing releases the GIL, so the files are hashed using up to the specified number of threads.
+        """
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda path: Checksums.digest(path, algorithm), paths))
+
+    @staticmethod
+    def record(path: Path, checksums: Dict[str, str]) -> None:
+        """
+        Record the checksums (keyed by algorithm) of the specified file (as it currently is on disk).
+
+        The records are merged with those saved by other processes (such as concurrent workers) before being saved.
+        """
+        stat = path.stat()
+        with Checksums._lock, Checksums._cache.locked():
+            records = Checksums._cache.load()
+            record = records.get(str(path), {})
+            if record.get("size") != stat.st_size or record.get("mtime") != stat.st_mtime_ns:
+                record = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+            record.update(checksums)
+            records[str(path)] = record
+            Checksums._cache.save(records)
+            Checksums._records = records
+
+    @staticmethod
+    def reset() -> None:
+        """Discard the loaded records, so that checksums recorded by other processes are seen."""
+        with Checksums._lock:
+            Checksums._records = None
+
+    @staticmethod
+    def recorded(path: Path, algorithm: str = "md5") -> Optional[str]:
+        """Return the recorded checksum of the specified file, or None if the file has changed or is not recorded."""
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        with Checksums._lock:
+            record = Checksums._get_records().get(str(path))
+        if record is None or record.get("size") != stat.st_size or record.get("mtime") != stat.st_mtime_ns:
+            return None
+        return cast(Optional[str], record.get(algorithm))
+
+
+def _download(url: str, partfile: Path, md5: Optional[str]) -> Dict[str, str]:
+    hashers = {i: new_hash(i) for i in DIGESTS}
+    offset = partfile.stat().st_size if partfile.exists() else 0
+    if offset:
+        with partfile.open("rb") as existing:
+            for chunk in iter(lambda: existing.read(CHUNK_SIZE), b""):
+                for hasher in hashers.values():
+                    hasher.update(chunk)
+    request = Request(url, headers={"Range": "bytes=%d-" % offset} if offset else {})
+    Metrics.increment("http_requests")
+    try:
+        with Trace.span("urlopen", "network", url=url):
+            response: Optional[HTTPResponse] = cast(HTTPResponse, urlopen(request))
+    except HTTPError as ex:
+        if ex.code != 416:
+            raise
+        response = None  # the partial download is already complete
+    if response is not None:
+        with response:
+            if offset and response.status != 206:
+                hashers = {i: new_hash(i) for i in DIGESTS}
+                offset = 0
+            with Trace.span("download", "network", url=url), partfile.open("ab" if offset else "wb") as part:
+                for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                    for hasher in hashers.values():
+                        hasher.update(chunk)
+                    part.write(chunk)
+                    Metrics.increment("http_bytes", len(chunk))
+    digests = {k: v.hexdigest() for k, v in hashers.items()}
+    if md5 is not None and digests["md5"] != md5:
+        partfile.unlink()
+        raise PortError("Fetch: checksum mismatch for %s (expected MD5 %s, got %s)" % (url, md5, digests["md5"]))
+    return digests
+
+
+def fetch(url: str, distfile: Path, md5: Optional[str] = None) -> Path:
+    """
+    Fetch the specified URL to the distfile, verifying the MD5 checksum (if given).
+
+    An existing distfile is kept if it matches the checksum (or if no checksum is given).  The download is written to a
+    ".part" file, which is resumed (using a HTTP Range request) if a previous download was interrupted, and is only
+    renamed to the distfile once verified.  The MD5 and SHA256 checksums are computed while downloading and recorded
+    (see Checksums), so that generating the port's distinfo does not need to read the distfile again.
+    """
+    if distfile.exists():
+        if md5 is None or Checksums.digest(distfile) == md5:
+            return distfile
+        distfile.unlink()
+    print("Fetching %s..." % distfile.name)
+    partfile = distfile.with_name(distfile.name + ".part")
+    distfile.parent.mkdir(parents=True, exist_ok=True)
+    resumed = partfile.exists()
+    try:
+        digests = _download(url, partfile, md5)
+    except PortError:
+        if not resumed:
+            raise
+        # the partial download may have been corrupt, try once more from the start
+        digests = _download(url, partfile, md5)
+    partfile.rename(distfile)
+    Checksums.record(distfile, digests)
+    return distfile
+
+
+def fetch_all(distfiles: Iterable[Tuple[str, Path, Optional[str]]],
+              workers: Optional[int] = None) -> List[Tuple[Path, Optional[Exception]]]:
+    """
+    Fetch the specified (url, distfile, md5) tuples concurrently.
+
+    Returns the distfile and, if fetching failed, the exception for each tuple (in the order given).
+    """
+    def fetch_one(distfile: Tuple[str, Path, Optional[str]]) -> Tuple[Path, Optional[Exception]]:
+        try:
+            return fetch(*distfile), None
+        except (OSError, PortError) as ex:
+            return distfile[1], ex
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(fetch_one, distfiles))
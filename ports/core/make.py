@@ -1,21 +1,34 @@
 """Simple representation of a bmake(1) Makefile."""
 from collections import OrderedDict
+from fnmatch import fnmatchcase
+from functools import partial
 from pathlib import Path
 from os import environ
-from re import compile as re_compile
+from re import compile as re_compile, escape
 from subprocess import check_output
-from typing import Dict, Iterable, List, Optional, Set, Union
-from ..utilities import Stream
+from typing import Dict, Iterable, List, Match, Optional, Set, Tuple, Union
+from .metrics import Metrics
+from .trace import Trace
 
-__all__ = ["MakeDict", "make_var", "make_vars"]
+__all__ = ["MakeDict", "load_makefile", "make_var", "make_vars"]
 
 MAKE_CMD = environ.get("MAKE", default="make")
 
-VARIABLE_ASSIGNMENT = re_compile(r"^\s*(\w+)\s*([+?:]?)=(.*)$")
+VARIABLE_ASSIGNMENT = re_compile(r"^\s*((?:\w|\$\{[^}]*\}|\$\([^)]*\))+)\s*([+?:!]?)=(.*)$")
+
+DIRECTIVE = re_compile(r"^\.\s*(-?\w+)\s*(.*)$")
+
+FUNCTION = re_compile(r"(defined|empty|exists|make|target|commands)\s*\(")
+
+TARGET = re_compile(r"^[^\s=:#][^=]*?::?(?!=)")
+
+INCLUDE_DEPTH = 32
 
 
 def make(path: Path, *args: str) -> str:
-    return check_output((MAKE_CMD, '-C', str(path)) + args, text=True)
+    Metrics.increment("make_forks")
+    with Trace.span("make", "make", path=str(path), args=list(args)):
+        return check_output((MAKE_CMD, '-C', str(path)) + args, text=True)
 
 
 def make_var(path: Path, var: str) -> List[str]:
@@ -23,51 +36,424 @@ def make_var(path: Path, var: str) -> List[str]:
     return make_vars(path)[var]
 
 
-def make_vars(path: Path) -> "MakeDict":
-    """Return an object representing the variables from the Makefile in the specified path."""
-    variables = MakeDict()
-    with open(path / "Makefile", "r") as makefile:
-        data = Stream(makefile.readlines(), lambda x: x.split("#", 2)[0].rstrip())
-        while True:
-            lines = list(data.take_while(lambda x: x.endswith("\\"), inclusive=True))
-            if not lines:
-                break
-            var = VARIABLE_ASSIGNMENT.search(" ".join(line.rstrip("\\") for line in lines))
-            if var is not None:
-                name = var.group(1)
-                modifier = var.group(2)
-                values = var.group(3).split()
-                if modifier == "+":
-                    variables.extend(name, values)
-                elif modifier == "?":
-                    variables.add(name, values)
-                elif modifier == ":":
-                    variables.add(name, values)
-                    variables.set(name, variables[name])
-                else:
-                    assert not modifier
-                    variables.set(name, values)
+def make_vars(path: Path, includes: Iterable[Path] = ()) -> "MakeDict":
+    """
+    Return an object representing the variables from the Makefile in the specified path.
+
+    System includes (i.e. `.include <file>`) are searched for in the specified include directories and are ignored if
+    not found.
+    """
+    return load_makefile(path / "Makefile", MakeDict({".CURDIR": str(path)}), includes)
+
+
+def load_makefile(makefile: Path, variables: "MakeDict", includes: Iterable[Path] = ()) -> "MakeDict":
+    """Evaluate the specified Makefile, adding its variables to the specified MakeDict."""
+    with Trace.span("load_makefile", "parse", makefile=str(makefile)):
+        _Makefile(variables, list(includes)).include(makefile)
     return variables
 
 
+def _logical_lines(text: str) -> List[str]:
+    """
+    Split the text of a Makefile into logical lines.
+
+    Comments (from "#" to the end of the line) and trailing whitespace are removed, and a line ending with a backslash
+    is joined (with a space, and without the backslash) to the line that follows.
+    """
+    lines = text.split("\n")
+    if not lines[-1]:
+        lines.pop()
+    logical: List[str] = []
+    continued: List[str] = []
+    for line in lines:
+        if "#" in line:
+            line = line[:line.index("#")]
+        line = line.rstrip()
+        if line.endswith("\\"):
+            continued.append(line.rstrip("\\"))
+        elif continued:
+            continued.append(line)
+            logical.append(" ".join(continued))
+            continued = []
+        else:
+            logical.append(line)
+    if continued:
+        logical.append(" ".join(continued))
+    return logical
+
+
+def _scan(text: str, start: int, terminators: str) -> Tuple[str, int]:
+    """
+    Scan text from the start index up to (but not including) an unnested terminator character.
+
+    A backslash escapes a terminator and nested variable references are skipped.  Returns the scanned text (with
+    escapes removed) and the index of the terminator (or the length of the text).
+    """
+    result: List[str] = []
+    depth = 0
+    i = start
+    while i < len(text):
+        char = text[i]
+        if char == "\\" and i + 1 < len(text) and text[i + 1] in terminators and not depth:
+            result.append(text[i + 1])
+            i += 2
+            continue
+        if char == "$" and i + 1 < len(text) and text[i + 1] in "{(":
+            depth += 1
+            result.append(text[i:i + 2])
+            i += 2
+            continue
+        if depth and char in "})":
+            depth -= 1
+        elif not depth and char in terminators:
+            break
+        result.append(char)
+        i += 1
+    return "".join(result), i
+
+
+def _number(value: str) -> Optional[float]:
+    try:
+        return float(int(value, 16)) if value.lower().startswith("0x") else float(value)
+    except ValueError:
+        return None
+
+
+def _sysv_substitute(word: str, old: str, new: str) -> str:
+    """Apply a SysV style substitution (e.g. ":.c=.o" or ":%.c=%.o") to a word."""
+    if "%" in old:
+        prefix, suffix = old.split("%", 1)
+        if word.startswith(prefix) and word.endswith(suffix) and len(word) >= len(prefix) + len(suffix):
+            return new.replace("%", word[len(prefix):len(word) - len(suffix)], 1)
+        return word
+    if old and word.endswith(old):
+        return word[:-len(old)] + new
+    return word
+
+
+def _loop_end(lines: List[str], start: int) -> int:
+    """Return the index of the `.endfor` that closes the `.for` loop whose body starts at the specified index."""
+    depth = 1
+    for i in range(start, len(lines)):
+        directive = DIRECTIVE.match(lines[i])
+        if directive is not None and directive.group(1) in ("for", "endfor"):
+            depth += 1 if directive.group(1) == "for" else -1
+            if not depth:
+                return i
+    raise ValueError("Make: .for without .endfor")
+
+
+class _Condition:
+    # pylint: disable=too-few-public-methods
+    """Evaluator for the expression of a conditional directive (e.g. `.if`)."""
+
+    OPERATORS = ("==", "!=", "<=", ">=", "<", ">")
+
+    def __init__(self, variables: "MakeDict", expression: str, default: str = "defined") -> None:
+        self._variables = variables
+        self._expression = expression
+        self._default = default
+        self._pos = 0
+
+    def evaluate(self) -> bool:
+        value = self._or()
+        self._skip()
+        if self._pos != len(self._expression):
+            raise ValueError("Make: malformed conditional '%s'" % self._expression)
+        return value
+
+    def _skip(self) -> None:
+        while self._pos < len(self._expression) and self._expression[self._pos].isspace():
+            self._pos += 1
+
+    def _accept(self, token: str) -> bool:
+        self._skip()
+        if self._expression.startswith(token, self._pos):
+            self._pos += len(token)
+            return True
+        return False
+
+    def _or(self) -> bool:
+        value = self._and()
+        while self._accept("||"):
+            value = self._and() or value
+        return value
+
+    def _and(self) -> bool:
+        value = self._not()
+        while self._accept("&&"):
+            value = self._not() and value
+        return value
+
+    def _not(self) -> bool:
+        self._skip()
+        if self._expression.startswith("!", self._pos) and not self._expression.startswith("!=", self._pos):
+            self._pos += 1
+            return not self._not()
+        if self._accept("("):
+            value = self._or()
+            if not self._accept(")"):
+                raise ValueError("Make: unbalanced parenthesis in conditional '%s'" % self._expression)
+            return value
+        return self._primary()
+
+    def _term(self) -> Tuple[str, bool]:
+        """Return the next operand and whether it was a bare word."""
+        self._skip()
+        expression = self._expression
+        if expression.startswith("\"", self._pos):
+            value, end = _scan(expression, self._pos + 1, "\"")
+            self._pos = end + 1
+            return self._variables.expand(value), False
+        if expression.startswith("${", self._pos) or expression.startswith("$(", self._pos):
+            _, end = _scan(expression, self._pos + 2, "})")
+            value = expression[self._pos:end + 1]
+            self._pos = end + 1
+            return self._variables.expand(value), False
+        start = self._pos
+        while self._pos < len(expression) and not expression[self._pos].isspace() and \
+                expression[self._pos] not in "!=<>()&|":
+            self._pos += 1
+        return expression[start:self._pos], True
+
+    def _function(self, name: str, argument: str) -> bool:
+        variables = self._variables
+        if name == "defined":
+            return variables.expand(argument).strip() in variables
+        if name == "empty":
+            return not variables.expand("${%s}" % argument).strip()
+        if name == "exists":
+            return (Path(variables.context.get(".CURDIR", ".")) / variables.expand(argument).strip()).exists()
+        if name in ("commands", "make", "target"):
+            return False
+        raise ValueError("Make: unknown function '%s' in conditional" % name)
+
+    def _primary(self) -> bool:
+        self._skip()
+        function = FUNCTION.match(self._expression, self._pos)
+        if function is not None:
+            argument, end = _scan(self._expression, function.end(), ")")
+            self._pos = end + 1
+            return self._function(function.group(1), argument)
+        lhs, bare = self._term()
+        for operator in _Condition.OPERATORS:
+            if self._accept(operator):
+                rhs, _ = self._term()
+                return self._compare(lhs, operator, rhs)
+        number = _number(lhs)
+        if number is not None:
+            return number != 0
+        if bare:
+            return self._function(self._default, lhs)
+        return bool(lhs.strip())
+
+    def _compare(self, lhs: str, operator: str, rhs: str) -> bool:
+        left = _number(lhs)
+        right = _number(rhs)
+        if left is not None and right is not None:
+            return {
+                "==": left == right, "!=": left != right, "<": left < right,
+                "<=": left <= right, ">": left > right, ">=": left >= right,
+            }[operator]
+        if operator == "==":
+            return lhs.strip() == rhs.strip()
+        if operator == "!=":
+            return lhs.strip() != rhs.strip()
+        if not lhs.strip() or not rhs.strip():
+            # the system includes (e.g. defining OSVERSION or ARCH) are not evaluated, so treat such variables as
+            # undefined rather than failing
+            return False
+        raise ValueError("Make: cannot compare strings '%s' and '%s' with '%s'" % (lhs, rhs, operator))
+
+
+class _Makefile:
+    # pylint: disable=too-few-public-methods
+    """Evaluator for the directives and assignments of a Makefile (and its includes)."""
+
+    def __init__(self, variables: "MakeDict", includes: List[Path]) -> None:
+        self._variables = variables
+        self._includes = includes
+        self._files: List[Path] = []
+
+    def include(self, makefile: Path) -> None:
+        """Evaluate the specified Makefile."""
+        if len(self._files) >= INCLUDE_DEPTH:
+            raise ValueError("Make: includes nested too deeply at %s" % makefile)
+        context = self._variables.context
+        parsedir = context.get(".PARSEDIR")
+        context[".PARSEDIR"] = str(makefile.parent)
+        self._files.append(makefile)
+        # Each entry is: (enclosing conditional active, a branch has been taken, this branch active)
+        conditionals: List[Tuple[bool, bool, bool]] = []
+        with open(makefile, "r") as source:
+            text = source.read()
+        Metrics.increment("makefiles_parsed")
+        self._evaluate(_logical_lines(text), conditionals)
+        if conditionals:
+            raise ValueError("Make: unterminated conditional in %s" % makefile)
+        self._files.pop()
+        if parsedir is None:
+            del context[".PARSEDIR"]
+        else:
+            context[".PARSEDIR"] = parsedir
+
+    def _evaluate(self, lines: List[str], conditionals: List[Tuple[bool, bool, bool]]) -> None:
+        """Evaluate the logical lines, where conditionals is the stack of enclosing conditional directives."""
+        recipe = False
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            i += 1
+            if recipe and line.startswith("\t"):
+                continue
+            recipe = False
+            directive = DIRECTIVE.match(line)
+            if directive is not None and directive.group(1) == "for":
+                end = _loop_end(lines, i)
+                if not conditionals or conditionals[-1][2]:
+                    self._for(directive.group(2), lines[i:end], conditionals)
+                i = end + 1
+            elif directive is not None:
+                self._directive(directive.group(1), directive.group(2), conditionals)
+            elif not conditionals or conditionals[-1][2]:
+                if not self._assign(line) and TARGET.match(line):
+                    recipe = True
+
+    def _for(self, argument: str, body: List[str], conditionals: List[Tuple[bool, bool, bool]]) -> None:
+        """Evaluate the body of a `.for` loop for each iteration, substituting the loop variables as bmake(1) does."""
+        names, separator, values = argument.partition(" in ")
+        names_list = names.split()
+        if not separator or not names_list:
+            raise ValueError("Make: malformed .for '%s'" % argument)
+        words = self._variables.expand(values).split()
+        if len(words) % len(names_list):
+            raise ValueError("Make: wrong number of words in .for '%s'" % argument)
+        pattern = re_compile(r"\$([{(])(%s)([:})])" % "|".join(escape(i) for i in names_list))
+
+        def substitute(iteration: Dict[str, str], match: Match[str]) -> str:
+            value = iteration[match.group(2)]
+            if match.group(3) == ":":
+                return "$%s:U%s:" % (match.group(1), value)
+            return value
+        for start in range(0, len(words), len(names_list)):
+            iteration = dict(zip(names_list, words[start:start + len(names_list)]))
+            self._evaluate([pattern.sub(partial(substitute, iteration), line) for line in body], conditionals)
+
+    def _assign(self, line: str) -> bool:
+        var = VARIABLE_ASSIGNMENT.search(line)
+        if var is None:
+            return False
+        variables = self._variables
+        name = var.group(1)
+        if "$" in name:
+            name = variables.expand(name)
+        modifier = var.group(2)
+        values = var.group(3).split()
+        if modifier == "+":
+            variables.extend(name, values)
+        elif modifier == "?":
+            variables.add(name, values)
+        elif modifier == ":":
+            variables.set(name, variables.expand(" ".join(values), keep_undefined=True).split())
+        elif modifier == "!":
+            pass  # shell assignments are not supported, leave the variable undefined
+        else:
+            assert not modifier
+            variables.set(name, values)
+        return True
+
+    def _directive(self, name: str, argument: str, conditionals: List[Tuple[bool, bool, bool]]) -> None:
+        active = not conditionals or conditionals[-1][2]
+        if name.startswith("if"):
+            value = active and self._condition(name[2:], argument)
+            conditionals.append((active, value, value))
+        elif name.startswith("elif"):
+            if not conditionals:
+                raise ValueError("Make: .%s without .if" % name)
+            enclosing, taken, _ = conditionals[-1]
+            value = enclosing and not taken and self._condition(name[4:], argument)
+            conditionals[-1] = (enclosing, taken or value, value)
+        elif name == "else":
+            if not conditionals:
+                raise ValueError("Make: .else without .if")
+            enclosing, taken, _ = conditionals[-1]
+            conditionals[-1] = (enclosing, True, enclosing and not taken)
+        elif name == "endif":
+            if not conditionals:
+                raise ValueError("Make: .endif without .if")
+            conditionals.pop()
+        elif not active:
+            pass
+        elif name in ("include", "sinclude", "-include", "dinclude"):
+            self._include(argument, name != "include")
+        elif name == "undef":
+            for variable in self._variables.expand(argument).split():
+                self._variables.pop(variable, default=[])
+        elif name == "endfor":
+            raise ValueError("Make: .endfor without .for")
+        elif name == "error":
+            raise ValueError("Make: %s" % self._variables.expand(argument))
+
+    def _condition(self, kind: str, argument: str) -> bool:
+        if kind in ("", "def", "ndef"):
+            value = _Condition(self._variables, argument).evaluate()
+        elif kind in ("make", "nmake"):
+            value = _Condition(self._variables, argument, default="make").evaluate()
+        else:
+            raise ValueError("Make: unknown conditional '.if%s'" % kind)
+        return not value if kind.startswith("n") else value
+
+    def _include(self, argument: str, optional: bool) -> None:
+        argument = argument.strip()
+        if len(argument) < 2 or (argument[0], argument[-1]) not in (("<", ">"), ("\"", "\"")):
+            raise ValueError("Make: malformed include '%s'" % argument)
+        name = Path(self._variables.expand(argument[1:-1]))
+        if argument[0] == "\"":
+            directories = [self._files[-1].parent, Path(self._variables.context.get(".CURDIR", "."))]
+        else:
+            directories = []
+            optional = True
+        for directory in directories + self._includes:
+            path = directory / name
+            if path.is_file():
+                self.include(path)
+                return
+        if not optional:
+            raise ValueError("Make: cannot open include file %s" % name)
+
+
 class MakeDict:
     """
     A representation of a bmake(1) Makefile.
 
-    This class only handles a simplified subset of the bmake(1) Makefile.  Only variable assingment and simple
-    variable expansion is supported.
+    Variables are stored as the list of (unexpanded) words they were assigned.  Indexing a MakeDict only expands
+    words that are entirely a variable reference (e.g. "${PORTNAME}"), so that values like "${PORTNAME}_${DISTVERSION}"
+    survive loading and regenerating a port.  The result of indexing is memoised per variable until that variable, or
+    a variable it references, is changed.  MakeDict.expand() and MakeDict.evaluate() perform full bmake(1) style
+    expansion, including embedded references and the common modifiers (:M, :N, :S, :C, :tl, :tu, :H, :T, :E, :R, :O,
+    :u, :Q, :U, :D, :L and SysV style substitution).
 
     The following Makefile variable assignment operators map to this class as follows:
      - "=" -> MakeDict.set()
      - "+=" -> MakeDict.extend()
      - "?=" -> MakeDict.add()
-     - ":=" -> not directly supported (but MakeDict.set(MakeDict[n])) could approximate)
+     - ":=" -> MakeDict.set(MakeDict.expand(...)), leaving references to undefined variables unexpanded
     """
 
-    def __init__(self) -> None:
-        """Initialise a new instance of the MakeDict class."""
+    def __init__(self, context: Optional[Dict[str, str]] = None) -> None:
+        """
+        Initialise a new instance of the MakeDict class.
+
+        The context holds read-only built-in variables (such as ".CURDIR") that are available for expansion but are
+        not considered part of the collection.
+        """
         self._variables: Dict[str, List[str]] = OrderedDict()
         self._internal: Set[str] = set()
+        self._expanding: Set[str] = set()
+        self._resolved: Dict[str, List[str]] = {}
+        self._references: Dict[str, Set[str]] = {}
+        self._dependents: Dict[str, Set[str]] = {}
+        self.context: Dict[str, str] = {} if context is None else context
 
     def __contains__(self, item: str) -> bool:
         """Indicate if the specified variable name is contained in this collection."""
@@ -75,19 +461,7 @@ class MakeDict:
 
     def __getitem__(self, item: str) -> List[str]:
         """Get a variable's value, expanding if needed."""
-        values = self._variables[item]
-        subbed_values: List[str] = []
-        for value in values:
-            if value.startswith("${") and value.endswith("}"):
-                variable = value[2:-1]
-                if variable in self._variables:
-                    subbed_values.extend(self[variable])
-                    self._internal.add(variable)
-                else:
-                    subbed_values.append(value)
-            else:
-                subbed_values.append(value)
-        return subbed_values
+        return list(self._resolve(item))
 
     def __str__(self) -> str:
         """Return a string representation of all public variables."""
@@ -97,6 +471,208 @@ class MakeDict:
                 unpopped.append("%s=%s" % (key, value))
         return ", ".join(unpopped)
 
+    def _invalidate(self, name: str) -> None:
+        """Discard the memoised values of the specified variable and of all variables that (indirectly) reference it."""
+        pending = [name]
+        while pending:
+            name = pending.pop()
+            self._resolved.pop(name, None)
+            self._references.pop(name, None)
+            pending.extend(i for i in self._dependents.pop(name, ()) if i in self._resolved)
+
+    def _referenced(self, name: str) -> Set[str]:
+        """Return the names of the defined variables (indirectly) referenced by the resolved variable."""
+        referenced: Set[str] = set()
+        pending = list(self._references[name])
+        while pending:
+            reference = pending.pop()
+            if reference in self._variables and reference not in referenced:
+                referenced.add(reference)
+                pending.extend(self._references[reference])
+        return referenced
+
+    def _resolve(self, name: str) -> List[str]:
+        """
+        Return the value of the specified variable with whole word references substituted.
+
+        The result is memoised, along with the names the value references (including undefined variables, whose
+        references are kept as is) so that the result can be discarded if any of those variables change.
+        """
+        if name in self._resolved:
+            return self._resolved[name]
+        if name in self._expanding:
+            raise ValueError("MakeDict: variable '%s' references itself" % name)
+        self._expanding.add(name)
+        try:
+            values: List[str] = []
+            references: Set[str] = set()
+            for value in self._variables[name]:
+                if value.startswith("${") and value.endswith("}"):
+                    variable = value[2:-1]
+                    references.add(variable)
+                    if variable in self._variables:
+                        values.extend(self._resolve(variable))
+                        continue
+                values.append(value)
+        finally:
+            self._expanding.remove(name)
+        for reference in references:
+            self._dependents.setdefault(reference, set()).add(name)
+        self._resolved[name] = values
+        self._references[name] = references
+        return values
+
+    def _reference(self, reference: str, keep_undefined: bool) -> str:
+        """Expand the body of a variable reference (i.e. "VAR:modifiers" from "${VAR:modifiers}")."""
+        name, end = _scan(reference, 0, ":")
+        if "$" in name:
+            name = self.expand(name)
+        defined = name in self._variables or name in self.context
+        if not defined and keep_undefined:
+            return "${%s}" % reference
+        if name in self._variables:
+            if name in self._expanding:
+                raise ValueError("MakeDict: variable '%s' references itself" % name)
+            self._expanding.add(name)
+            try:
+                value = self.expand(" ".join(self._variables[name]))
+            finally:
+                self._expanding.remove(name)
+        else:
+            value = self.context.get(name, "")
+        if end < len(reference):
+            value = self._modify(name, value, defined, reference[end + 1:])
+        return value
+
+    def _modify(self, name: str, value: str, defined: bool, modifiers: str) -> str:
+        # pylint: disable=too-many-branches,too-many-statements
+        """Apply the (colon separated) modifiers to the specified value."""
+        i = 0
+        while i < len(modifiers):
+            modifier = modifiers[i]
+            words = value.split()
+            if modifier in "MN":
+                pattern, i = _scan(modifiers, i + 1, ":")
+                pattern = self.expand(pattern)
+                value = " ".join(w for w in words if fnmatchcase(w, pattern) == (modifier == "M"))
+            elif modifier in "SC" and i + 1 < len(modifiers):
+                delimiter = modifiers[i + 1]
+                old, i = _scan(modifiers, i + 2, delimiter)
+                new, i = _scan(modifiers, i + 1, delimiter)
+                flags, i = _scan(modifiers, i + 1, ":")
+                value = self._substitute(modifier, words, self.expand(old), self.expand(new), flags)
+            elif modifier in "UD":
+                argument, i = _scan(modifiers, i + 1, ":")
+                if defined == (modifier == "D"):
+                    value = self.expand(argument)
+                elif modifier == "D":
+                    value = ""
+            elif modifier == "L":
+                value = name
+                i += 1
+            else:
+                word, i = _scan(modifiers, i, ":")
+                if word == "tl":
+                    value = value.lower()
+                elif word == "tu":
+                    value = value.upper()
+                elif word == "H":
+                    value = " ".join(w.rsplit("/", 1)[0] if "/" in w else "." for w in words)
+                elif word == "T":
+                    value = " ".join(w.rsplit("/", 1)[-1] for w in words)
+                elif word == "E":
+                    value = " ".join(w.rsplit(".", 1)[1] for w in words if "." in w.rsplit("/", 1)[-1])
+                elif word == "R":
+                    value = " ".join(w.rsplit(".", 1)[0] if "." in w.rsplit("/", 1)[-1] else w for w in words)
+                elif word == "O":
+                    value = " ".join(sorted(words))
+                elif word == "Or":
+                    value = " ".join(sorted(words, reverse=True))
+                elif word == "u":
+                    value = " ".join(w for j, w in enumerate(words) if not j or words[j - 1] != w)
+                elif word in ("Q", "q"):
+                    value = "".join("\\" + c if not c.isalnum() and c not in "_-./,+@%=:" else c for c in value)
+                elif "=" in word:
+                    old, new = self.expand(word).split("=", 1)
+                    value = " ".join(_sysv_substitute(w, old, new) for w in words)
+                else:
+                    raise ValueError("MakeDict: unsupported modifier ':%s' for variable '%s'" % (word, name))
+            i += 1
+        return value
+
+    @staticmethod
+    def _substitute(modifier: str, words: List[str], old: str, new: str, flags: str) -> str:
+        """Apply the :S or :C modifier to each word."""
+        if modifier == "S":
+            prefix = "^" if old.startswith("^") else ""
+            suffix = "$" if old.endswith("$") and not old.endswith("\\$") else ""
+            pattern = re_compile(prefix + escape(old[len(prefix):len(old) - len(suffix)]) + suffix)
+        else:
+            pattern = re_compile(old)
+
+        def replace(match: Match[str]) -> str:
+            result: List[str] = []
+            j = 0
+            while j < len(new):
+                char = new[j]
+                if char == "\\" and j + 1 < len(new):
+                    if modifier == "C" and new[j + 1].isdigit():
+                        result.append(match.group(int(new[j + 1])) or "")
+                    else:
+                        result.append(new[j + 1])
+                    j += 2
+                    continue
+                result.append(match.group(0) if char == "&" else char)
+                j += 1
+            return "".join(result)
+
+        if "W" in flags:
+            words = [" ".join(words)]
+        count = 0 if "g" in flags else 1
+        result: List[str] = []
+        for word in words:
+            if "1" in flags and result != words[:len(result)]:
+                result.append(word)
+            else:
+                result.append(pattern.sub(replace, word, count=count))
+        return " ".join(result)
+
+    def expand(self, text: str, keep_undefined: bool = False) -> str:
+        """
+        Expand all variable references in the specified text.
+
+        References to undefined variables expand to an empty string, unless keep_undefined is specified in which case
+        they (and "$$") are left as is, matching bmake(1)'s behaviour for ":=" assignments.
+        """
+        if "$" not in text:
+            return text
+        result: List[str] = []
+        i = 0
+        while i < len(text):
+            j = text.find("$", i)
+            if j == -1 or j + 1 == len(text):
+                result.append(text[i:])
+                break
+            result.append(text[i:j])
+            char = text[j + 1]
+            if char == "$":
+                result.append("$$" if keep_undefined else "$")
+                i = j + 2
+            elif char in "{(":
+                _, end = _scan(text, j + 2, "}" if char == "{" else ")")
+                if end == len(text):
+                    raise ValueError("MakeDict: unterminated variable reference in '%s'" % text)
+                result.append(self._reference(text[j + 2:end], keep_undefined))
+                i = end + 1
+            else:
+                result.append(self._reference(char, keep_undefined) if char in self else text[j:j + 2])
+                i = j + 2
+        return "".join(result)
+
+    def evaluate(self, name: str) -> List[str]:
+        """Return the fully expanded value of the specified variable (an undefined variable evaluates as empty)."""
+        return self.expand("${%s}" % name).split()
+
     def add(self, name: str, values: List[str]) -> None:
         """Add (if not existing) the specified variable name and list of string values to this collection."""
         if name not in self._variables:
@@ -116,6 +692,7 @@ class MakeDict:
         """Extend the specified variable with the specified list of strings."""
         if name in self._variables:
             self._variables[name].extend(values)
+            self._invalidate(name)
         else:
             self.set(name, values)
 
@@ -124,15 +701,18 @@ class MakeDict:
         Pop the specified variable from this collection as a list of strings.
 
         If the keyword "default" is passed then that value, a list of strings, is returns if the specified variable
-        does not exist in this collection.
+        does not exist in this collection.  The (defined) variables referenced by the popped value are considered
+        internal, and are therefore no longer reported as unpopped.
         """
         if "default" in kwargs and name not in self:
             return kwargs["default"]
-        values = self[name]
+        values = self._resolve(name)
+        self._internal.update(self._referenced(name))
         del self._variables[name]
+        self._invalidate(name)
         if name in self._internal:
             self._internal.remove(name)
-        return values
+        return list(values)
 
     def pop_value(self, name: str, **kwargs: Optional[Union[str, bool]]) -> Optional[str]:
         """
@@ -160,3 +740,4 @@ class MakeDict:
     def set(self, name: str, values: List[str]) -> None:
         """Set the specified variable to the specified value."""
         self._variables[name] = values
+        self._invalidate(name)
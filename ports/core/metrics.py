@@ -0,0 +1,124 @@
+"""Counters of the work done by a run of portcran, reported as JSON or in the Prometheus text format."""
+from json import dumps
+from pathlib import Path
+from threading import Lock
+from typing import Any, ClassVar, Dict, Optional, Tuple
+
+__all__ = ["Metrics"]
+
+COUNTERS: Dict[str, Tuple[str, Optional[str]]] = {
+    "make_forks": ("Number of make(1) processes run", None),
+    "makefiles_parsed": ("Number of Makefiles parsed in-process", None),
+    "ports_loaded": ("Number of ports promoted from a stub to a loaded port", None),
+    "factory_failures": ("Number of ports that no factory could load", None),
+    "http_requests": ("Number of HTTP requests made", None),
+    "http_bytes": ("Number of bytes downloaded", None),
+    "bytes_decompressed": ("Number of bytes decompressed from tarballs", None),
+    "cache_hits": ("Number of cache lookups that found a valid entry", "cache"),
+    "cache_misses": ("Number of cache lookups that found no valid entry", "cache"),
+}
+
+PROMETHEUS_PREFIX = "portcran_"
+
+
+class Metrics:
+    """
+    A registry of counters, updated by the core modules.
+
+    Each counter is listed (with its help text and optional label) in COUNTERS.  Counting is always enabled, as it is
+    cheap, and once started Metrics.finish() writes the report.  Counters recorded by worker processes can be collected
+    using Metrics.drain() in the worker and Metrics.merge() in the parent.
+    """
+
+    report: ClassVar[Optional[str]] = None
+    output: ClassVar[Optional[Path]] = None
+    _counters: ClassVar[Dict[str, Dict[str, int]]] = {}
+    _lock: ClassVar[Lock] = Lock()
+
+    @staticmethod
+    def start(report: str, output: Optional[Path] = None) -> None:
+        """Report the counters in the specified format ("json" or "prometheus") at exit, to the file or stdout."""
+        assert report in ("json", "prometheus")
+        Metrics.report = report
+        Metrics.output = output
+
+    @staticmethod
+    def finish() -> None:
+        """Write the report (if started), and stop reporting."""
+        if Metrics.report is None:
+            return
+        report = Metrics.json() + "\n" if Metrics.report == "json" else Metrics.prometheus()
+        if Metrics.output is None:
+            print(report, end="")
+        else:
+            # replace atomically, as the Prometheus textfile collector may read the file at any time
+            tmpfile = Metrics.output.with_name(".%s.tmp" % Metrics.output.name)
+            tmpfile.write_text(report)
+            tmpfile.rename(Metrics.output)
+        Metrics.report = None
+        Metrics.output = None
+
+    @staticmethod
+    def increment(name: str, value: int = 1, label: str = "") -> None:
+        """Increment the named counter (for the specified label value, if the counter is labelled)."""
+        assert name in COUNTERS
+        assert bool(label) == (COUNTERS[name][1] is not None)
+        with Metrics._lock:
+            counter = Metrics._counters.setdefault(name, {})
+            counter[label] = counter.get(label, 0) + value
+
+    @staticmethod
+    def hit(cache: str, hit: bool) -> None:
+        """Count a lookup in the specified cache as a hit or a miss."""
+        Metrics.increment("cache_hits" if hit else "cache_misses", label=cache)
+
+    @staticmethod
+    def drain() -> Dict[str, Dict[str, int]]:
+        """Remove and return the counters."""
+        with Metrics._lock:
+            counters = Metrics._counters
+            Metrics._counters = {}
+        return counters
+
+    @staticmethod
+    def merge(counters: Dict[str, Dict[str, int]]) -> None:
+        """Add the counters (drained from another process)."""
+        for name, values in counters.items():
+            for label, value in values.items():
+                Metrics.increment(name, value, label)
+
+    @staticmethod
+    def json() -> str:
+        """
+        Return the counters as a JSON object.
+
+        Unlabelled counters are numbers and labelled counters are objects keyed by label.  The hit ratio of each cache
+        is included as "cache_hit_ratio".
+        """
+        report: Dict[str, Any] = {}
+        with Metrics._lock:
+            for name, (_, label) in COUNTERS.items():
+                values = Metrics._counters.get(name, {})
+                report[name] = dict(sorted(values.items())) if label else values.get("", 0)
+        caches = sorted(set(report["cache_hits"]) | set(report["cache_misses"]))
+        report["cache_hit_ratio"] = {
+            i: report["cache_hits"].get(i, 0) / (report["cache_hits"].get(i, 0) + report["cache_misses"].get(i, 0))
+            for i in caches
+        }
+        return dumps(report, indent=2)
+
+    @staticmethod
+    def prometheus() -> str:
+        """Return the counters in the Prometheus text exposition format (as read by the textfile collector)."""
+        lines = []
+        with Metrics._lock:
+            for name, (description, label) in COUNTERS.items():
+                metric = "%s%s_total" % (PROMETHEUS_PREFIX, name)
+                lines.append("# HELP %s %s." % (metric, description))
+                lines.append("# TYPE %s counter" % metric)
+                values = Metrics._counters.get(name, {})
+                if label:
+                    lines.extend('%s{%s="%s"} %d' % (metric, label, k, v) for k, v in sorted(values.items()))
+                else:
+                    lines.append("%s %d" % (metric, values.get("", 0)))
+        return "\n".join(lines) + "\n"
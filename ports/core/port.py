@@ -1,11 +1,14 @@
 """Classes describing a FreeBSD Port and the various structures."""
 from abc import ABCMeta, abstractmethod
+from hashlib import sha256
 from io import StringIO
 from itertools import groupby
 from math import ceil, floor
 from pathlib import Path
-from typing import (Any, Callable, Dict, Generic, IO, Iterable, Iterator, List, Optional, Set, Tuple, TypeVar, Union,
-                    cast)
+from sys import intern
+from time import time
+from typing import (Any, Callable, ClassVar, Dict, Generic, IO, Iterable, Iterator, List, Optional, Set, Tuple, TypeVar,
+                    Union, cast)
 from .dependency import Dependency
 from .make import MakeDict, make, make_vars
 from .platform import Platform
@@ -25,6 +28,20 @@ def peek(file: IO[Any], length: int) -> str:
     return value
 
 
+def update_file(path: Path, content: str) -> bool:
+    """Write the content to the specified file, unless the file already has that content (returns if written)."""
+    data = content.encode("utf-8")
+    try:
+        with path.open("rb") as current:
+            if sha256(current.read()).digest() == sha256(data).digest():
+                return False
+    except FileNotFoundError:
+        pass
+    with path.open("wb") as new:
+        new.write(data)
+    return True
+
+
 class PortValue(Orderable, Generic[T], metaclass=ABCMeta):  # pylint: disable=E1136
     def __init__(self, section: int, order: int = 1) -> None:
         super().__init__()
@@ -112,6 +129,8 @@ class PortVarList(PortValue[List[str]]):  # pylint: disable=E1136
 
 
 class PortObject(object, metaclass=ABCMeta):  # pylint: disable=E1136
+    __slots__ = ()
+
     @abstractmethod
     def generate(self) -> Iterable[Tuple[str, Iterable[str]]]:
         raise NotImplementedError()
@@ -143,6 +162,8 @@ class PortObj(PortValue[T2]):  # pylint: disable=E1136
 
 
 class PortLicense(PortObject, Iterable[str]):
+    __slots__ = ("_licenses", "combination", "file")
+
     def __init__(self) -> None:
         super().__init__()
         self._licenses: Set[str] = set()
@@ -173,7 +194,11 @@ class PortLicense(PortObject, Iterable[str]):
 
 class PortDepends(PortObject):
     # pylint: disable=too-few-public-methods
+    __slots__ = ("_depends", "build", "lib", "run", "test")
+
     class Collection(object):
+        __slots__ = ("name", "_depends")
+
         def __init__(self, name: str) -> None:
             self.name = name
             self._depends: List[Dependency] = []
@@ -210,7 +235,11 @@ class PortDepends(PortObject):
 
 
 class PortBroken(PortObject):
+    __slots__ = ("reasons",)
+
     class Category(object):
+        __slots__ = ("arch", "opsys", "osrel")
+
         def __init__(self, arch: str = None, opsys: str = None, osrel: str = None) -> None:
             self.arch = arch
             self.opsys = opsys
@@ -275,6 +304,8 @@ class PortBroken(PortObject):
 
 
 class PortUses(PortObject):
+    __slots__ = ("_uses",)
+
     def __init__(self) -> None:
         super().__init__()
         self._uses: Dict[type, Uses] = {}
@@ -319,14 +350,21 @@ class PortError(Exception):
 
 
 class PortStub(object):
+    __slots__ = ("category", "name", "_origin", "_portdir")
+
     def __init__(self, category: str, name: str, portdir: Optional[Path] = None) -> None:
-        self.category = category
+        self.category = intern(category)
         self.name = name
+        self._origin = intern("%s/%s" % (category, name))
         self._portdir = portdir
 
     def __repr__(self) -> str:
         return "<Port: %s>" % self.origin
 
+    @property
+    def origin(self) -> str:
+        return self._origin
+
     @property
     def portdir(self) -> Path:
         if self._portdir is None:
@@ -334,12 +372,10 @@ class PortStub(object):
             return Ports.dir / self.category / self.name
         return self._portdir
 
-    @property
-    def origin(self) -> str:
-        return "%s/%s" % (self.category, self.name)
-
 
 class Port(PortStub):
+    _schemas: ClassVar[Dict[type, Tuple[List[PortValue[Any]], List[PortValue[Any]]]]] = {}
+
     portname = PortVar(1, 1, "PORTNAME")
     portversion = PortVar(1, 2, "PORTVERSION")
     distversion = PortVar(1, 4, "DISTVERSION")
@@ -382,16 +418,30 @@ class Port(PortStub):
             categories.remove(value)
         self.categories = [value] + categories
 
+    @property
+    def origin(self) -> str:
+        # unlike a PortStub the category may change, so the origin is not stored
+        return "%s/%s" % (self.category, self.name)
+
     @categories.setter
     def categories(self, categories: List[str]) -> List[str]:
         if not categories:
             raise PortError("Port: invalid categories, must start with: %s" % self.category)
+        # the name is only set once the port (and its categories) are initialised
+        if hasattr(self, "name") and categories[0] != self.category:
+            from ports.core.ports import Ports
+            Ports.move_port(self, "%s/%s" % (categories[0], self.name))
         return categories
 
     @property
     def descr(self) -> Path:
         return self.portdir / "pkg-descr"
 
+    @property
+    def distfiles(self) -> List[Path]:
+        """The paths of the port's distfiles, or an empty list if not known."""
+        return []
+
     @property
     def pkgname(self) -> str:
         return "%s%s" % (self.pkgnameprefix or "", self.portname)
@@ -411,7 +461,7 @@ class Port(PortStub):
         port_makefile = self.portdir / "Makefile"
         metadata: List[str] = []
         if port_makefile.exists():
-            with port_makefile.open("rU") as makefile_file:
+            with port_makefile.open("r") as makefile_file:
                 for line in iter(makefile_file.readline, ""):
                     if line.startswith("# Created by") or line.startswith("# $FreeBSD"):
                         metadata.append(line)
@@ -422,7 +472,8 @@ class Port(PortStub):
         makefile.writelines(metadata)
 
     def _gen_sections(self, makefile: StringIO) -> None:
-        for _, items in groupby(sorted(list(self._values.items()), key=lambda k: k[0]), lambda k: k[0].section):
+        ordered = [(i, self._values[i]) for i in Port._schema(type(self))[1] if i in self._values]
+        for _, items in groupby(ordered, lambda k: k[0].section):
             values = [j for i in items for j in i[0].generate(i[1])]
             if not values:
                 continue
@@ -451,33 +502,65 @@ class Port(PortStub):
                         width += len(i)
                 makefile.write("\n")
 
+    def _distinfo_current(self) -> bool:
+        """Indicate if the distinfo file records the SHA256 and SIZE of exactly the port's (known) distfiles."""
+        from ports.core.fetch import Checksums
+        distinfo = self.portdir / "distinfo"
+        if not self.distfiles or not distinfo.exists():
+            return False
+        recorded: Dict[Tuple[str, str], str] = {}
+        with distinfo.open("r") as distinfo_file:
+            for line in distinfo_file:
+                key, _, value = line.partition(" = ")
+                if key.startswith(("SHA256 (", "SIZE (")) and key.endswith(")"):
+                    algorithm, _, name = key[:-1].partition(" (")
+                    recorded[(algorithm, name)] = value.strip()
+        if {i for _, i in recorded} != {i.name for i in self.distfiles}:
+            return False
+        for distfile in self.distfiles:
+            if not distfile.exists() or recorded.get(("SIZE", distfile.name)) != str(distfile.stat().st_size) or \
+                    recorded.get(("SHA256", distfile.name)) != Checksums.digest(distfile, "sha256"):
+                return False
+        return True
+
     def _gen_distinfo(self) -> None:
-        make(self.portdir, 'makesum')
+        from ports.core.fetch import Checksums
+        if self._distinfo_current():
+            return
+        if not self.distfiles:
+            make(self.portdir, 'makesum')
+            return
+        distinfo = ["TIMESTAMP = %d\n" % time()]
+        for distfile in self.distfiles:
+            distinfo.append("SHA256 (%s) = %s\n" % (distfile.name, Checksums.digest(distfile, "sha256")))
+            distinfo.append("SIZE (%s) = %d\n" % (distfile.name, distfile.stat().st_size))
+        update_file(self.portdir / "distinfo", "".join(distinfo))
 
     def _gen_descr(self) -> None:
         if self.description is None:
             if self.descr.exists():
                 self.descr.unlink()
         else:
-            with self.descr.open("w") as descr:
-                width = 0
-                for word in self.description.split():
-                    next_line = word[-1] == "\n"
-                    word = word.rstrip("\n")
-                    if width == -1 or width + len(word) + 1 > 79:
-                        descr.write("\n")
-                        width = 0
-                    elif width:
-                        descr.write(" ")
-                        width += 1
-                    descr.write(word)
-                    if next_line:
-                        width = -1
-                    else:
-                        width += len(word)
-                descr.write("\n")
-                if self.website is not None:
-                    descr.write("\nWWW: %s\n" % self.website)
+            descr = StringIO()
+            width = 0
+            for word in self.description.split():
+                next_line = word[-1] == "\n"
+                word = word.rstrip("\n")
+                if width == -1 or width + len(word) + 1 > 79:
+                    descr.write("\n")
+                    width = 0
+                elif width:
+                    descr.write(" ")
+                    width += 1
+                descr.write(word)
+                if next_line:
+                    width = -1
+                else:
+                    width += len(word)
+            descr.write("\n")
+            if self.website is not None:
+                descr.write("\nWWW: %s\n" % self.website)
+            update_file(self.descr, descr.getvalue())
 
     def _gen_plist(self) -> None:
         raise NotImplementedError("Generic Port does not know how to create pkg-plist")
@@ -487,22 +570,34 @@ class Port(PortStub):
         self._gen_header(makefile)
         self._gen_sections(makefile)
         self._gen_footer(makefile)
-        with open(self.portdir / "Makefile", "w") as portmakefile:
-            portmakefile.write(makefile.getvalue())
+        update_file(self.portdir / "Makefile", makefile.getvalue())
         self._gen_distinfo()
         self._gen_descr()
         self._gen_plist()
 
+    @staticmethod
+    def _schema(port_class: type) -> Tuple[List[PortValue[Any]], List[PortValue[Any]]]:
+        """
+        Return the PortValues of the specified Port class, in load order and in generation order.
+
+        PortValues are loaded in the order they are declared, searching the base classes breadth first, and are
+        generated in (section, order) order.  The schema is computed on first use and kept for each class.
+        """
+        if port_class not in Port._schemas:
+            schema: List[PortValue[Any]] = []
+            bases = [port_class]
+            i = 0
+            while i < len(bases):
+                bases.extend(j for j in bases[i].__bases__ if j not in bases)
+                schema.extend(var for var in vars(bases[i]).values() if isinstance(var, PortValue))
+                i += 1
+            Port._schemas[port_class] = schema, sorted(schema)
+        return Port._schemas[port_class]
+
     def load(self) -> None:
         variables = make_vars(self.portdir)
-        bases = [type(self)]
-        i = 0
-        while i < len(bases):
-            bases.extend(j for j in bases[i].__bases__ if j not in bases)
-            for var in list(vars(bases[i]).values()):
-                if isinstance(var, PortValue):
-                    var.load(self, variables)
-            i += 1
+        for var in Port._schema(type(self))[0]:
+            var.load(self, variables)
         if not variables.all_popped:
             # TODO: remove once all R-cran ports have been verified
             print("Unloaded variables for %s:" % self.name, variables)
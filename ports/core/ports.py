@@ -3,65 +3,334 @@
 This module provides an interface to interact with the FreeBSD Ports Collection, and means of discovering ports
 therein.
 """
+from concurrent.futures import ThreadPoolExecutor
 from os import environ
-from typing import Callable, ClassVar, List, Optional
+from sys import stderr
+from typing import Any, Callable, ClassVar, Dict, List, Optional, Tuple
 from pathlib import Path
-from .make import make, make_var
+from .cache import Cache
+from .make import MakeDict, load_makefile, make_var, make_vars
+from .metrics import Metrics
 from .port import Port, PortError, PortStub
+from .trace import Trace, traced
+from ..utilities import LazyAttribute
 
 __all__ = ['Ports']
 
+AMBIGUOUS = -1
+
+DEPENDS = ('BUILD_DEPENDS', 'LIB_DEPENDS', 'RUN_DEPENDS', 'TEST_DEPENDS')
+
+
+def _stat(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
 
 class Ports:
     """Representation of the FreeBSD Ports Collection."""
 
     _factories: ClassVar[List[Callable[[PortStub], Optional[Port]]]] = []
     _ports: ClassVar[List[PortStub]] = []
+    _names: ClassVar[Dict[str, int]] = {}
+    _origins: ClassVar[Dict[str, int]] = {}
+    _missing: ClassVar[Dict[str, str]] = {}
+    _rdepends: ClassVar[Optional[Dict[str, List[str]]]] = None
+    _makefiles: ClassVar[Dict[Path, Optional[Tuple[int, int]]]] = {}
+    _loaded: ClassVar[Dict[int, Optional[Tuple[int, int]]]] = {}
+    _index: ClassVar[Optional[Dict[str, Any]]] = None
     dir: ClassVar[Path] = Path(environ.get('PORTSDIR', '/usr/ports'))
+    progress: ClassVar[bool] = False
+    workers: ClassVar[Optional[int]] = int(environ['PORTCRAN_JOBS']) if environ.get('PORTCRAN_JOBS') else None
 
-    categories = make_var(dir, 'SUBDIR')
-    distdir = Path(environ.get('DISTDIR') or make(dir / 'Mk', '-VDISTDIR', '-fbsd.port.mk').strip())
+    @LazyAttribute
+    def categories(cls) -> List[str]:  # pylint: disable=no-self-argument
+        """
+        The categories in the ports collection.
+
+        The categories are cached in the index against the top level Makefile's modification time and size.
+        """
+        makefile = cls.dir / 'Makefile'
+        stat = makefile.stat()
+        index = Ports._load_index()
+        entry = index.get('subdir')
+        if entry is not None and entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            Metrics.hit('index', True)
+            return list(entry['subdir'])
+        Metrics.hit('index', False)
+        subdir = make_var(cls.dir, 'SUBDIR')
+        index['subdir'] = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'subdir': subdir}
+        Cache('index', str(cls.dir)).save(index)
+        return subdir
+
+    @LazyAttribute
+    def distdir(cls) -> Path:  # pylint: disable=no-self-argument
+        """
+        The directory where distfiles are stored.
+
+        This is evaluated in-process as bsd.port.mk would: from the environment, then make.conf(5) and lastly the
+        default of ${PORTSDIR}/distfiles.
+        """
+        if environ.get('DISTDIR'):
+            return Path(environ['DISTDIR'])
+        variables = MakeDict({'.CURDIR': str(cls.dir / 'Mk')})
+        variables.set('PORTSDIR', [str(cls.dir)])
+        make_conf = Path(environ.get('__MAKE_CONF', '/etc/make.conf'))
+        if make_conf.is_file():
+            load_makefile(make_conf, variables)
+        variables.add('DISTDIR', ['${PORTSDIR}/distfiles'])
+        return Path(' '.join(variables.evaluate('DISTDIR')))
 
     @staticmethod
-    def _get_port(selector: Callable[[PortStub], bool]) -> Port:
+    def _add_port(port: PortStub) -> None:
+        position = len(Ports._ports)
+        Ports._ports.append(port)
+        Ports._names[port.name] = AMBIGUOUS if port.name in Ports._names else position
+        Ports._origins[port.origin] = AMBIGUOUS if port.origin in Ports._origins else position
+
+    @staticmethod
+    def _find(key: str, index: Dict[str, int]) -> int:
         if not Ports._ports:
             Ports._load_ports()
-        ports = [i for i in Ports._ports if selector(i)]
-        if not ports:
+        position = index.get(key)
+        if position is None:
             raise PortError('Ports: no port matches requirement')
-        if len(ports) > 1:
+        if position == AMBIGUOUS:
             raise PortError('Ports: multiple ports match requirement')
-        if isinstance(ports[0], PortStub):
-            portstub = ports[0]
-            for factory in reversed(Ports._factories):
+        return position
+
+    @staticmethod
+    def _get_port(key: str, index: Dict[str, int]) -> Port:
+        if key in Ports._missing:
+            raise PortError(Ports._missing[key])
+        try:
+            position = Ports._find(key, index)
+        except PortError as ex:
+            Ports._missing[key] = ex.args[0]
+            raise
+        portstub = Ports._ports[position]
+        if isinstance(portstub, Port):
+            return portstub
+        for factory in reversed(Ports._factories):
+            with Trace.span("factory", "ports", origin=portstub.origin):
                 port = factory(portstub)
-                if port is not None:
-                    Ports._ports[Ports._ports.index(ports[0])] = port
-                    break
-            else:
-                raise PortError('Ports: unable to create port from origin \'%s\'' % ports[0].origin)
-        else:
-            assert isinstance(ports[0], Port)
-            port = ports[0]
-        return port
+            if port is not None:
+                Metrics.increment('ports_loaded')
+                Ports._ports[position] = port
+                Ports._loaded[position] = _stat(port.portdir / 'Makefile')
+                return port
+        Metrics.increment('factory_failures')
+        Ports._missing[key] = 'Ports: unable to create port from origin \'%s\'' % portstub.origin
+        raise PortError(Ports._missing[key])
 
     @staticmethod
-    def _load_ports() -> None:
-        print('Loading ports collection:')
-        for category in Ports.categories:
+    def _load_index() -> Dict[str, Any]:
+        """Return the index of the categories' ports (see Cache), loading it if not already loaded."""
+        index = Ports._index
+        if index is None:
+            index = Cache('index', str(Ports.dir)).load()
+            Ports._index = index
+        return index
+
+    @staticmethod
+    def _load_category(category: str, index: Dict[str, Any]) -> List[str]:
+        """Return the ports in the specified category, using the index entry if the category Makefile is unchanged."""
+        makefile = Ports.dir / category / 'Makefile'
+        stat = makefile.stat()
+        Ports._makefiles[makefile] = (stat.st_mtime_ns, stat.st_size)
+        entry = index.get(category)
+        if entry is not None and entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            Metrics.hit('index', True)
+            return list(entry['subdir'])
+        Metrics.hit('index', False)
+        if Ports.progress:
             print('\tLoading category: %s' % category)
-            for name in make_var(Ports.dir / category, 'SUBDIR'):
-                Ports._ports.append(PortStub(category, name))
+        with Trace.span('load_category', 'ports', category=category):
+            subdir = make_var(Ports.dir / category, 'SUBDIR')
+        index[category] = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'subdir': subdir}
+        return subdir
+
+    @staticmethod
+    def _load_depends(port: PortStub, index: Dict[str, Any]) -> List[str]:
+        """
+        Return the origins the specified port depends on, using the index entry if the port Makefile is unchanged.
+
+        A port whose Makefile cannot be evaluated is reported (to stderr) and treated as having no dependencies.
+        """
+        try:
+            stat = (port.portdir / 'Makefile').stat()
+        except OSError:
+            return []
+        entry = index.get(port.origin)
+        if entry is not None and entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            Metrics.hit('depends', True)
+            return list(entry['depends'])
+        Metrics.hit('depends', False)
+        try:
+            variables = make_vars(port.portdir)
+            depends = set()
+            for name in DEPENDS:
+                for depend in variables.evaluate(name):
+                    if ':' in depend:
+                        origin = depend.split(':')[1].split('@')[0]
+                        depends.add('/'.join(origin.strip('/').split('/')[-2:]))
+        except (OSError, ValueError) as ex:
+            # not cached, so that the port is evaluated again
+            print('Unable to evaluate the dependencies of %s: %s' % (port.origin, ex), file=stderr)
+            return []
+        index[port.origin] = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'depends': sorted(depends)}
+        return sorted(depends)
+
+    @staticmethod
+    @traced('ports')
+    def _load_rdepends() -> Dict[str, List[str]]:
+        """
+        Load the reverse dependencies (from BUILD, LIB, RUN and TEST_DEPENDS) of all ports in the collection.
+
+        The dependencies of each port are cached against its Makefile's modification time and size, so only changed
+        ports are evaluated again.
+        """
+        cache = Cache('depends', str(Ports.dir))
+        index = cache.load()
+        ports = index.get('ports', {})
+        stubs = Ports.get_stubs()
+        updated = {i.origin: ports[i.origin] for i in stubs if i.origin in ports}
+        rdepends: Dict[str, List[str]] = {}
+        with ThreadPoolExecutor(max_workers=Ports.workers) as executor:
+            for stub, depends in zip(stubs, executor.map(lambda port: Ports._load_depends(port, updated), stubs)):
+                for depend in depends:
+                    rdepends.setdefault(depend, []).append(stub.origin)
+        if updated != ports:
+            index['ports'] = updated
+            cache.save(index)
+        return rdepends
+
+    @staticmethod
+    @traced('ports')
+    def _load_ports() -> None:
+        """
+        Load the stubs for all ports in the collection.
+
+        Categories are loaded concurrently using up to Ports.workers threads (by default as many as the
+        ThreadPoolExecutor would choose), with the stubs kept in category order.  Progress is only reported if
+        Ports.progress is set.
+        """
+        if Ports.progress:
+            print('Loading ports collection:')
+        Ports._makefiles[Ports.dir / 'Makefile'] = _stat(Ports.dir / 'Makefile')
+        index = Ports._load_index()
+        categories = index.get('categories', {})
+        updated = {
+            k: v for k, v in categories.items()
+            if k in Ports.categories  # pylint: disable=unsupported-membership-test  # pylint sees the LazyAttribute
+        }
+        with ThreadPoolExecutor(max_workers=Ports.workers) as executor:
+            subdirs = executor.map(lambda category: Ports._load_category(category, updated), Ports.categories)
+            for category, names in zip(Ports.categories, subdirs):
+                for name in names:
+                    Ports._add_port(PortStub(category, name))
+        if updated != categories:
+            index['categories'] = updated
+            Cache('index', str(Ports.dir)).save(index)
+
+    @staticmethod
+    def add_port(port: PortStub) -> None:
+        """Add a newly created port to the collection, so that it may be found by name and origin."""
+        if not Ports._ports:
+            Ports._load_ports()
+        Ports._add_port(port)
+        Ports._missing.pop(port.name, None)
+        Ports._missing.pop(port.origin, None)
+        Ports._rdepends = None
+
+    @staticmethod
+    def move_port(port: PortStub, origin: str) -> None:
+        """Update the index of the collection for a port (if in the collection) whose origin is about to change."""
+        position = Ports._origins.get(port.origin)
+        if position is None or position == AMBIGUOUS or Ports._ports[position] is not port:
+            return
+        del Ports._origins[port.origin]
+        Ports._origins[origin] = AMBIGUOUS if origin in Ports._origins else position
+        Ports._missing.pop(origin, None)
+        Ports._rdepends = None
+
+    @staticmethod
+    def get_stubs() -> List[PortStub]:
+        """Get all ports in the collection (as a PortStub, or as a Port if already loaded)."""
+        if not Ports._ports:
+            Ports._load_ports()
+        return list(Ports._ports)
 
     @staticmethod
     def get_port_by_name(name: str) -> Port:
         """Get a port by the specified name."""
-        return Ports._get_port(lambda i: i.name == name)
+        return Ports._get_port(name, Ports._names)
 
     @staticmethod
     def get_port_by_origin(origin: str) -> Port:
         """Get a port by the specified port origin."""
-        return Ports._get_port(lambda i: i.origin == origin)
+        return Ports._get_port(origin, Ports._origins)
+
+    @staticmethod
+    def get_reverse_depends(origin: str) -> List[str]:
+        """Get the origins of the ports that depend (via BUILD, LIB, RUN or TEST_DEPENDS) on the specified origin."""
+        if Ports._rdepends is None:
+            Ports._rdepends = Ports._load_rdepends()
+        return sorted(Ports._rdepends.get(origin, []))
+
+    @staticmethod
+    def get_stub_by_name(name: str) -> PortStub:
+        """
+        Get a port by the specified name, without loading it.
+
+        The PortStub (or the Port, if already loaded) is returned, which is sufficient to know the port's origin.  Use
+        get_port_by_name() when the port's contents are needed.
+        """
+        position = Ports._find(name, Ports._names)
+        return Ports._ports[position]
+
+    @staticmethod
+    def get_stub_by_origin(origin: str) -> PortStub:
+        """Get a port by the specified port origin, without loading it (see get_stub_by_name())."""
+        position = Ports._find(origin, Ports._origins)
+        return Ports._ports[position]
+
+    @staticmethod
+    def refresh() -> None:
+        """
+        Discard whatever was loaded from Makefiles that have since changed, for a long running process.
+
+        If the top level or a category Makefile has changed then the collection is reset (and the categories are
+        evaluated again), otherwise each loaded Port whose Makefile has changed is replaced by its PortStub.  Failed
+        lookups and the reverse dependencies are always discarded, as they depend on Makefiles that are not tracked.
+        """
+        if any(_stat(makefile) != stat for makefile, stat in Ports._makefiles.items()):
+            if _stat(Ports.dir / 'Makefile') != Ports._makefiles.get(Ports.dir / 'Makefile'):
+                LazyAttribute.reset(Ports, 'categories')
+            Ports.reset()
+            return
+        for position, stat in list(Ports._loaded.items()):
+            port = Ports._ports[position]
+            if _stat(port.portdir / 'Makefile') != stat:
+                Ports._ports[position] = PortStub(port.category, port.name, port.portdir)
+                del Ports._loaded[position]
+        Ports._missing = {}
+        Ports._rdepends = None
+
+    @staticmethod
+    def reset() -> None:
+        """Discard the loaded ports, so that the collection is loaded again when next needed."""
+        Ports._ports = []
+        Ports._names = {}
+        Ports._origins = {}
+        Ports._missing = {}
+        Ports._rdepends = None
+        Ports._makefiles = {}
+        Ports._loaded = {}
+        Ports._index = None
 
     @staticmethod
     def factory(factory: Callable[[PortStub], Optional[Port]]) -> Callable[[PortStub], Optional[Port]]:
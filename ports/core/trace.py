@@ -0,0 +1,141 @@
+"""Optional tracing of where time is spent, written in the Chrome trace event format."""
+from functools import wraps
+from json import dump
+from os import getpid
+from pathlib import Path
+from threading import Lock, get_ident
+from time import perf_counter_ns
+from types import TracebackType
+from typing import Any, Callable, ClassVar, Dict, List, Optional, Type, TypeVar, cast
+
+__all__ = ["Trace", "traced"]
+
+F = TypeVar("F", bound=Callable[..., Any])  # pylint: disable=C0103
+
+
+class _Span:
+    # pylint: disable=too-few-public-methods
+    """A timed span that records a complete event when it exits."""
+
+    __slots__ = ("_name", "_category", "_args", "_start")
+
+    def __init__(self, name: str, category: str, args: Dict[str, Any]) -> None:
+        self._name = name
+        self._category = category
+        self._args = args
+        self._start = 0
+
+    def __enter__(self) -> "_Span":
+        self._start = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type: Optional[Type[BaseException]], exc_value: Optional[BaseException],
+                 traceback: Optional[TracebackType]) -> None:
+        end = perf_counter_ns()
+        event = {
+            "name": self._name,
+            "cat": self._category,
+            "ph": "X",
+            "ts": self._start / 1000,
+            "dur": (end - self._start) / 1000,
+            "pid": getpid(),
+            "tid": get_ident(),
+        }
+        if self._args:
+            event["args"] = self._args
+        Trace.record(event)
+
+
+class _NullSpan:
+    # pylint: disable=too-few-public-methods
+    """A span that does nothing, used while tracing is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type: Optional[Type[BaseException]], exc_value: Optional[BaseException],
+                 traceback: Optional[TracebackType]) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    """
+    A record of timed (and possibly nested) spans.
+
+    Tracing is disabled by default, in which case a span costs a single attribute check.  Once started, every span
+    is recorded as a complete event, and Trace.finish() writes the events to the output file as a Chrome trace (as
+    viewed by chrome://tracing or https://ui.perfetto.dev).  Events recorded by worker processes can be collected
+    using Trace.drain() in the worker and Trace.extend() in the parent.
+    """
+
+    enabled: ClassVar[bool] = False
+    output: ClassVar[Optional[Path]] = None
+    _events: ClassVar[List[Dict[str, Any]]] = []
+    _lock: ClassVar[Lock] = Lock()
+
+    @staticmethod
+    def start(output: Path) -> None:
+        """Start tracing, to be written to the specified file."""
+        Trace.enabled = True
+        Trace.output = output
+
+    @staticmethod
+    def finish() -> None:
+        """Write the trace (if started) to the output file, and stop tracing."""
+        if Trace.output is not None:
+            events = Trace.drain()
+            with Trace.output.open("w") as output:
+                dump({"traceEvents": events, "displayTimeUnit": "ms"}, output)
+        Trace.enabled = False
+        Trace.output = None
+
+    @staticmethod
+    def span(__name: str, __cat: str, **args: Any) -> Any:
+        """
+        Return a context manager that times the enclosed code (when tracing is enabled) as the named span.
+
+        The name and category are positional-only, so that any keyword may be used for the span's arguments.
+        """
+        if not Trace.enabled:
+            return NULL_SPAN
+        return _Span(__name, __cat, args)
+
+    @staticmethod
+    def record(event: Dict[str, Any]) -> None:
+        """Record a trace event."""
+        with Trace._lock:
+            Trace._events.append(event)
+
+    @staticmethod
+    def drain() -> List[Dict[str, Any]]:
+        """Remove and return the recorded events."""
+        with Trace._lock:
+            events = Trace._events
+            Trace._events = []
+        return events
+
+    @staticmethod
+    def extend(events: List[Dict[str, Any]]) -> None:
+        """Record the events (drained from another process)."""
+        with Trace._lock:
+            Trace._events.extend(events)
+
+
+def traced(category: str, name: Optional[str] = None) -> Callable[[F], F]:
+    """Decorate a function so that each call is a span (named after the function unless a name is given)."""
+    def decorator(func: F) -> F:
+        span_name = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not Trace.enabled:
+                return func(*args, **kwargs)
+            with _Span(span_name, category, {}):
+                return func(*args, **kwargs)
+        return cast(F, wrapper)
+    return decorator
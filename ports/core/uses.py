@@ -7,6 +7,8 @@ __all__ = ["Uses"]
 
 
 class Uses(Orderable, metaclass=ABCMeta):
+    __slots__ = ("_args", "name")
+
     _uses: ClassVar[Dict[str, type]] = {}
 
     def __init__(self, name: str) -> None:
@@ -1,4 +1,5 @@
+from .packages import Package, Packages
 from .port import CranPort
 from .uses import Cran
 
-__all__ = ["Cran", "CranPort"]
+__all__ = ["Cran", "CranPort", "Package", "Packages"]
@@ -0,0 +1,84 @@
+"""Parsing of the ChangeLog and NEWS files of CRAN packages."""
+from re import compile as re_compile
+from typing import Dict, Iterable, List, Optional
+
+__all__ = ["parse_changelog"]
+
+DAY3 = r"(?:Mon|Tue|Wed|Thu|Fri|Sat|Sun)"
+
+MONTH3 = r"(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)"
+
+DATE = (
+    r"(?:" + (
+        r"\d{4}-\d{2}-\d{2}" +
+        r"|{day3} {month3} ".format(day3=DAY3, month3=MONTH3) +
+        r"\d{2} \d{2}:\d{2}:\d{2} \w{3} \d{4}") +
+    r")")
+
+EMPTY_LINE = re_compile(r"^\* (?:R|man|src)/[^:]*:$")
+
+VERSION_IDENTIFIER = [
+    r"\* DESCRIPTION(?: \(Version\))?: (?:New version is|Version) (?P<version0>.+)\.",
+    r"Changes to Version (?P<version1>.+)",
+    r"Initial Version (?P<version2>.+)",
+    r"Version (?P<version3>.+)",
+]
+
+LINE = ("* ", "( ", "o ")
+
+SECTION = [
+    r"{date},? .* <.*>".format(date=DATE),
+    r"\d{4}-\d{2}-\d{2}  .+",
+]
+
+# A single pattern matching either a version identifier (in order of precedence) or a section break
+CHANGELOG = re_compile("^(?:%s)$" % "|".join("(?:%s)" % i for i in VERSION_IDENTIFIER + SECTION))
+
+VERSION_GROUPS = ["version%d" % i for i in range(len(VERSION_IDENTIFIER))]
+
+
+def parse_changelog(lines: Iterable[str], version: str,
+                    versions: Optional[Iterable[str]] = None) -> Dict[str, List[str]]:
+    """
+    Parse the (stripped) lines of a changelog into a map of version to entries.
+
+    Any entries before the first version identifier belong to the specified (current) version.  Parsing stops once the
+    sections of all the requested versions (by default the current version) have been read, i.e. when a version
+    identifier follows the section of the last of them.
+    """
+    wanted = {version} if versions is None else set(versions)
+    changelog: Dict[str, List[List[str]]] = {}
+    entries: Optional[List[List[str]]] = None
+    labelled = False  # if the current section started with a version identifier
+    prev_line = ""
+    for line in lines:
+        match = CHANGELOG.match(line) if line else None
+        if match is not None and match.lastgroup in VERSION_GROUPS:
+            identifier = match.group(match.lastgroup)
+            if identifier != version:
+                if labelled:
+                    wanted.discard(version)
+                    if not wanted:
+                        break
+                version = identifier
+                entries = None
+            labelled = True
+            prev_line = ""
+            continue
+        if line == "" or match is not None:
+            prev_line = ""
+            continue
+        if entries is None:
+            entries = changelog.setdefault(version, [])
+        if line[:2] in LINE:
+            if EMPTY_LINE.match(line) is None:
+                prev_line = ""
+                entries.append([line[2:]])
+            else:
+                prev_line = line[2:]
+        elif not entries:
+            entries.append([prev_line + line])
+        else:
+            entries[-1].extend((prev_line, " ", line))
+            prev_line = ""
+    return {k: ["".join(i) for i in v] for k, v in changelog.items()}
@@ -0,0 +1,163 @@
+"""Metadata for all CRAN packages, taken from the repository's PACKAGES index."""
+from gzip import decompress
+from os import environ, stat
+from time import time
+from typing import ClassVar, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlparse
+from urllib.request import urlopen
+from ..core import PortError
+from ..core.cache import Cache
+from ..core.metrics import Metrics
+from ..core.trace import Trace
+
+__all__ = ["CONTRIB_URL", "Package", "Packages", "dependencies", "parse_packages"]
+
+CONTRIB_URL = environ.get("CRAN_CONTRIB", "https://cran.r-project.org/src/contrib")
+
+FIELDS = {
+    "Depends": "depends",
+    "Imports": "imports",
+    "LinkingTo": "linkingto",
+    "MD5sum": "md5sum",
+    "NeedsCompilation": "needs_compilation",
+    "Package": "name",
+    "Suggests": "suggests",
+    "Version": "version",
+}
+
+
+def dependencies(value: str) -> Iterator[Tuple[str, Optional[str]]]:
+    """Parse a CRAN dependency list (e.g. "R (>= 3.0), MASS") into (name, condition) pairs."""
+    for depend in (i.strip() for i in value.split(",")):
+        if depend:
+            name, _, condition = depend.partition("(")
+            yield name.strip(), condition.rstrip(")").strip() or None
+
+
+class Package(NamedTuple):
+    """The metadata of a CRAN package as listed in the PACKAGES index."""
+
+    name: str
+    version: str
+    depends: str = ""
+    imports: str = ""
+    linkingto: str = ""
+    suggests: str = ""
+    md5sum: Optional[str] = None
+    needs_compilation: Optional[str] = None
+
+    @property
+    def requires(self) -> List[str]:
+        """The names of the packages required (i.e. Depends and Imports) by this package."""
+        return [i for i, _ in dependencies(self.depends + "," + self.imports)]
+
+
+def parse_packages(lines: Iterable[str]) -> Dict[str, Package]:
+    """Parse a PACKAGES index (in Debian Control File format) into a map of package name to Package."""
+    packages: Dict[str, Package] = {}
+    record: Dict[str, str] = {}
+    key = None
+    for line in lines:
+        line = line.rstrip("\n")
+        if not line.strip():
+            if "name" in record:
+                packages[record["name"]] = Package(**record)
+            record = {}
+            key = None
+        elif line[0].isspace():
+            if key is not None:
+                record[key] += " " + line.strip()
+        else:
+            field, _, value = line.partition(":")
+            key = FIELDS.get(field)
+            if key is not None:
+                record[key] = value.strip()
+    if "name" in record:
+        packages[record["name"]] = Package(**record)
+    return packages
+
+
+class Packages:
+    """
+    The index of all packages available from CRAN.
+
+    The PACKAGES index is fetched once from Packages.index (the CRAN_PACKAGES environment variable, or PACKAGES.gz
+    from the CRAN contrib URL) and cached on disk for Packages.ttl seconds (PORTCRAN_CRAN_TTL, default 1 hour).  The
+    index may also be a local (optionally gzipped) file, in which case it is read directly and never cached.
+    """
+
+    index: ClassVar[str] = environ.get("CRAN_PACKAGES") or CONTRIB_URL + "/PACKAGES.gz"
+    ttl: ClassVar[int] = int(environ.get("PORTCRAN_CRAN_TTL", "3600"))
+    _packages: ClassVar[Optional[Dict[str, Package]]] = None
+    _loaded: ClassVar[float] = 0
+
+    @staticmethod
+    def _fetch() -> Dict[str, Package]:
+        location = urlparse(Packages.index)
+        if location.scheme in ("", "file"):
+            with open(location.path, "rb") as index:
+                return Packages._parse(index.read())
+        cache = Cache("cran-packages", Packages.index)
+        cached = cache.load()
+        if cached and time() - cached["fetched"] < Packages.ttl:
+            Metrics.hit("cran-packages", True)
+            return {k: Package(*v) for k, v in cached["packages"].items()}
+        Metrics.hit("cran-packages", False)
+        Metrics.increment("http_requests")
+        with Trace.span("urlopen", "network", url=Packages.index):
+            data = urlopen(Packages.index).read()
+        Metrics.increment("http_bytes", len(data))
+        packages = Packages._parse(data)
+        cache.save({"fetched": time(), "packages": packages})
+        return packages
+
+    @staticmethod
+    def _parse(data: bytes) -> Dict[str, Package]:
+        if data[:2] == b"\x1f\x8b":
+            data = decompress(data)
+        return parse_packages(data.decode("utf-8").splitlines())
+
+    @staticmethod
+    def get(name: str) -> Package:
+        """Get the metadata of the specified CRAN package."""
+        packages = Packages.load()
+        if name not in packages:
+            raise PortError("CRAN: package '%s' not found in %s" % (name, Packages.index))
+        return packages[name]
+
+    @staticmethod
+    def load() -> Dict[str, Package]:
+        """
+        Load the index, if not already loaded (e.g. before forking workers, so that each need not load it).
+
+        Returns a map of package name to Package.
+        """
+        packages = Packages._packages
+        if packages is None:
+            packages = Packages._fetch()
+            Packages._packages = packages
+            Packages._loaded = time()
+        return packages
+
+    @staticmethod
+    def refresh() -> None:
+        """
+        Discard the loaded index if it is stale, for a long running process.
+
+        A local index is stale once modified, otherwise the index is stale after Packages.ttl seconds.
+        """
+        location = urlparse(Packages.index)
+        if location.scheme in ("", "file"):
+            try:
+                stale = stat(location.path).st_mtime >= Packages._loaded
+            except OSError:
+                stale = True
+        else:
+            stale = time() - Packages._loaded >= Packages.ttl
+        if stale:
+            Packages.reset()
+
+    @staticmethod
+    def reset() -> None:
+        """Discard the loaded index, so that it is reloaded when next needed."""
+        Packages._packages = None
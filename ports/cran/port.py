@@ -1,11 +1,16 @@
 """The CranPort class that understands the CRAN package format."""
 from pathlib import Path
 from re import compile as re_compile
-from tarfile import TarFile
+from sys import stderr
 from traceback import print_exc
-from typing import Callable, Dict, Optional, Union, cast
+from typing import Any, Callable, Dict, List, Optional, Union, cast
+from .changelog import parse_changelog
+from .tarball import Tarball
 from .uses import Cran
 from ..core import Port, PortDepends, PortError, PortStub, Ports
+from ..core.cache import Cache
+from ..core.metrics import Metrics
+from ..core.trace import Trace, traced
 from ..dependency import PortDependency
 from ..utilities import Stream
 
@@ -83,63 +88,20 @@ EMPTY_LOG = [
     "* src/*c:",
 ]
 
-DAY3 = r"(?:Mon|Tue|Wed|Thu|Fri|Sat|Sun)"
-
-MONTH3 = r"(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)"
-
-DATE = (
-    r"(?:" + (
-        r"\d{4}-\d{2}-\d{2}" +
-        r"|{day3} {month3} ".format(day3=DAY3, month3=MONTH3) +
-        r"\d{2} \d{2}:\d{2}:\d{2} \w{3} \d{4}") +
-    r")")
-
-EMPTY_LINE = re_compile(r"^\* (?:R|man|src)/[^:]*:$")
-
-VERSION_IDENTIFIER = [
-    re_compile(r"^\* DESCRIPTION(?: \(Version\))?: (?:New version is|Version) (.+)\.$"),
-    re_compile(r"^Changes to Version (.+)$"),
-    re_compile(r"^Initial Version (.+)$"),
-    re_compile(r"^Version (.+)$"),
-]
-
-LINE = ("* ", "( ", "o ")
-
-SECTION = [
-    re_compile(r"^{date},? .* <.*>$".format(date=DATE)),
-    re_compile(r"^\d{4}-\d{2}-\d{2}  .+$")
-]
+CHANGELOGS = ("ChangeLog", "NEWS")
 
 DEPENDENCY = re_compile(r"([\w.]+)(?:\s*\((.*)\))?")
 
 ParseSignature = Callable[[str, str, int], None]
 
 
-def extractfile(tar_file: TarFile, name: str, filtr: Callable[[str], str], line: int = 1) -> Optional[Stream]:
+def extractfile(tar_file: Tarball, name: str, filtr: Callable[[str], str], line: int = 1) -> Optional[Stream]:
     """Extract the specified file from a tarball using the specifeid filter and an optional line offset."""
     try:
         stream = tar_file.extractfile(name)
     except KeyError:
         return None
-    return None if stream is None else Stream((line.decode('utf-8') for line in stream.readlines()), filtr, line)
-
-
-def version_identifier(line: str) -> Optional[str]:
-    """Try extract a version string from the specified line."""
-    for regex in VERSION_IDENTIFIER:
-        match = regex.match(line)
-        if match:
-            return match.group(1)
-    return None
-
-
-def section(line: str) -> bool:
-    """Determine if the specified line is a section break."""
-    for regex in SECTION:
-        match = regex.match(line)
-        if match:
-            return True
-    return False
+    return Stream((line.decode('utf-8') for line in stream), filtr, line)
 
 
 class CranPort(Port):
@@ -180,12 +142,12 @@ class CranPort(Port):
 
     _parse = Keywords()
 
-    def __init__(self, category: str, name: str, portdir: Optional[Path], distfile: Optional[TarFile] = None) -> None:
+    def __init__(self, category: str, name: str, portdir: Optional[Path], distfile: Optional[Tarball] = None) -> None:
         """
         Initialise a new instance of the CranPort class.
 
         The port's category and name must be specified.  Optionally the full path to the port directory and the source
-        package TarFile may be specified.
+        package Tarball may be specified.
         """
         super().__init__(category, Cran.PKGNAMEPREFIX + name, portdir)
         self.portname = name
@@ -193,8 +155,9 @@ class CranPort(Port):
             self.distname = "${PORTNAME}_${DISTVERSION}"
             self.uses[Cran].add("auto-plist")
             self.website = "https://CRAN.R-project.org/package=%s" % self.portname
-            self._load_descr(distfile)
+            description = self._load_descr(distfile)
             self._load_changelog(distfile)
+            CranPort._cache(name, self.version).save({"description": description, "changelog": self.changelog})
 
     @staticmethod
     def _add_dependency(depends: PortDepends.Collection, value: str, optional: bool = False) -> None:
@@ -205,8 +168,9 @@ class CranPort(Port):
             assert depend is not None
             name = depend.group(1).strip()
             if name not in INTERNAL_PACKAGES:
+                pkgname = Cran.PKGNAMEPREFIX + name
                 try:
-                    port = Ports.get_port_by_name(Cran.PKGNAMEPREFIX + name)
+                    port = Ports.get_stub_by_name(pkgname)
                 except PortError:
                     if not optional:
                         missing.append(name)
@@ -214,7 +178,7 @@ class CranPort(Port):
                         suggested.append(name)
                 else:
                     condition = ">0" if not depend.group(2) else depend.group(2).replace("-", ".").replace(" ", "")
-                    depends.add(PortDependency(port.pkgname, condition, port.origin))
+                    depends.add(PortDependency(pkgname, condition, port.origin))
         if suggested:
             print("Suggested package(s) does not exist: %s" % ", ".join(suggested))
         if missing:
@@ -232,6 +196,10 @@ class CranPort(Port):
                 # TODO: remove once all R-cran ports have been verified
                 print("Unable to load CranPort:", port.name)
                 print_exc()
+            except ValueError as ex:
+                # the Makefile uses a construct that cannot be evaluated in-process
+                print("Unable to load CranPort %s: %s" % (port.name, ex), file=stderr)
+                return None
             assert port.portname == portname
             assert port.distname in ("${PORTNAME}_${DISTVERSION}", "${PORTNAME}_${PORTVERSION}")
             assert Cran in port.uses
@@ -241,7 +209,12 @@ class CranPort(Port):
     def _gen_plist(self) -> None:
         pkg_plist = self.portdir / "pkg-plist"
         if pkg_plist.exists():
-            pkg_plist.delete()
+            pkg_plist.unlink()
+
+    @property
+    def distfiles(self) -> List[Path]:
+        """The path of the CRAN package tarball."""
+        return [Ports.distdir / ("%s_%s.tar.gz" % (self.portname, self.version))]
 
     @_parse.keyword("Depends", "Imports")
     def _parse(self, value: str) -> None:
@@ -306,57 +279,54 @@ class CranPort(Port):
     def _parse(self, value: str):
         self._add_dependency(self.depends.build, value)
 
-    def _load_changelog(self, distfile: TarFile) -> None:
-        for name in ("ChangeLog", "NEWS"):
+    @traced("parse")
+    def _load_changelog(self, distfile: Tarball) -> None:
+        for name in CHANGELOGS:
             changelog = extractfile(distfile, "%s/%s" % (self.portname, name), lambda x: x.strip(), line=0)
             if changelog is not None:
                 break
         else:
             return
-        version = self.version
-        prev_line = ""
-        while True:
-            for line in changelog.take_while(lambda l: not version_identifier(l)):
-                if line == "" or section(line):
-                    prev_line = ""
-                    continue
-                if line is not None:
-                    if version not in self.changelog:
-                        self.changelog[version] = []
-                    if line[:2] in LINE:
-                        if EMPTY_LINE.match(line) is None:
-                            prev_line = ""
-                            self.changelog[version].append(line[2:])
-                        else:
-                            prev_line = line[2:]
-                    elif not self.changelog[version]:
-                        self.changelog[version].append(prev_line + line)
-                    else:
-                        self.changelog[version][-1] += prev_line + " " + line
-                        prev_line = ""
-            try:
-                version = cast(str, version_identifier(next(changelog)))
-                prev_line = ""
-            except StopIteration:
-                break
+        self.changelog = parse_changelog(changelog, self.version)
 
-    def _load_descr(self, distfile: TarFile) -> None:
+    @traced("parse")
+    def _load_descr(self, distfile: Tarball) -> Dict[str, str]:
         desc = extractfile(distfile, "%s/DESCRIPTION" % self.portname, lambda x: x.rstrip('\n'))
         if desc is None:
             raise NameError("CRAN '%s' package missing DESCRIPTION file")
         identifier = re_compile(r"^[a-zA-Z/@]+:")
         errors = []
+        fields = {}
         for line in desc:
             try:
                 key, value = line.split(":", 1)
                 lines = [value.strip()] + [i.strip() for i in desc.take_while(lambda l: not identifier.match(l))]
-                self._parse(key, " ".join(i for i in lines if i), desc.line)  # type: ignore
+                fields[key] = " ".join(i for i in lines if i)
+                self._parse(key, fields[key], desc.line)  # type: ignore
             except PortError as ex:
                 errors.append(ex)
         if errors:
             raise PortError("\n".join(e.args[0] for e in errors))
+        return fields
+
+    @staticmethod
+    def _cache(name: str, version: str) -> Cache:
+        return Cache("cran/%s_%s" % (name, version))
+
+    @staticmethod
+    def cached(name: str, version: str) -> Dict[str, Any]:
+        """
+        Return the cached DESCRIPTION fields and changelog of the specified CRAN package version.
+
+        The cache is filled whenever a CranPort is created from a package tarball.  The returned document has the keys
+        "description" and "changelog", or is empty if that version has not been seen.
+        """
+        cached = CranPort._cache(name, version).load()
+        Metrics.hit("cran", bool(cached))
+        return cached
 
     @staticmethod
+    @traced("cran", "CranPort.create")
     def create(name: str, distfile: Path, portdir: Optional[Path] = None) -> "CranPort":
         """
         Create a CranPort from a CRAN package tarball.
@@ -371,7 +341,13 @@ class CranPort(Port):
             categories = port.categories
         except PortError:
             pass
-        cran = CranPort(categories[0], name, portdir, TarFile.open(str(distfile), "r:gz"))
+        # only one changelog is needed, so a NEWS that precedes the (preferred) ChangeLog in the tarball is used
+        changelogs = ["%s/%s" % (name, i) for i in CHANGELOGS]
+        with Trace.span("decompress", "tar", distfile=str(distfile)):
+            tarball = Tarball(distfile, ["%s/DESCRIPTION" % name], changelogs)
+        Metrics.increment("bytes_decompressed", tarball.bytes_decompressed)
+        with tarball:
+            cran = CranPort(categories[0], name, portdir, tarball)
         cran.categories = categories
         if port is not None:
             cran.maintainer = cast(str, port.maintainer)
@@ -0,0 +1,82 @@
+"""Single pass extraction of selected members from a CRAN package tarball."""
+from gzip import GzipFile
+from pathlib import Path
+from shutil import copyfileobj
+from tarfile import TarFile
+from tempfile import SpooledTemporaryFile
+from typing import IO, Dict, Iterable, Optional, Sequence, Type
+from types import TracebackType
+
+__all__ = ["Tarball"]
+
+SPOOL_SIZE = 1 << 20
+
+
+class _CountingReader:
+    # pylint: disable=too-few-public-methods
+    """A file-like wrapper that counts the bytes read."""
+
+    def __init__(self, fileobj: GzipFile) -> None:
+        self._fileobj = fileobj
+        self.count = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._fileobj.read(size)
+        self.count += len(data)
+        return data
+
+
+class Tarball:
+    """
+    The selected members of a gzip compressed tarball, read in a single forward pass.
+
+    The tarball is decompressed as a stream and only the required members and the alternative members are kept (in
+    memory, or spilled to a temporary file if large).  The alternatives are listed in order of preference, of which
+    only one is needed, so decompression stops once all required members and any alternative have been found.  As the
+    order of the members depends on the tar used to build the tarball, a less preferred alternative (e.g. NEWS) may
+    therefore be found instead of a preferred alternative (e.g. ChangeLog) that follows it.  Otherwise, if not all
+    members were found, the whole tarball is read.
+    """
+
+    def __init__(self, path: Path, required: Iterable[str], alternatives: Sequence[str] = ()) -> None:
+        """Read the required members, and at least one alternative member, from the tarball at the specified path."""
+        self._members: Dict[str, IO[bytes]] = {}
+        self.bytes_decompressed = 0
+        wanted = set(required)
+        optional = set(alternatives)
+        found_alternative = not optional
+        with GzipFile(str(path), "rb") as gzip_file:
+            reader = _CountingReader(gzip_file)
+            with TarFile.open(fileobj=reader, mode="r|") as tar_file:  # type: ignore
+                for info in tar_file:
+                    name = info.name.rstrip("/")
+                    if (name in wanted or name in optional) and info.isfile():
+                        extracted = tar_file.extractfile(info)
+                        assert extracted is not None
+                        spool = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+                        copyfileobj(extracted, spool)
+                        self._members[name] = spool
+                        wanted.discard(name)
+                        found_alternative = found_alternative or name in optional
+                        if not wanted and found_alternative:
+                            break
+            self.bytes_decompressed = reader.count
+
+    def __enter__(self) -> "Tarball":
+        return self
+
+    def __exit__(self, exc_type: Optional[Type[BaseException]], exc_value: Optional[BaseException],
+                 traceback: Optional[TracebackType]) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Discard the extracted members."""
+        for member in self._members.values():
+            member.close()
+        self._members.clear()
+
+    def extractfile(self, name: str) -> IO[bytes]:
+        """Return a file object of the specified member, raising KeyError if the member was not read."""
+        member = self._members[name]
+        member.seek(0)
+        return member
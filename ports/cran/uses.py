@@ -6,6 +6,8 @@ __all__ = ["Cran"]
 
 @Uses.register("cran")
 class Cran(Uses):
+    __slots__ = ()
+
     PKGNAMEPREFIX = "R-cran-"
 
     def __init__(self) -> None:
@@ -1,4 +1,5 @@
 from re import match
+from sys import intern
 from typing import Optional
 from .core import Dependency
 
@@ -6,6 +7,8 @@ __all__ = ["LibDependency", "LocalBaseDependency", "PortDependency"]
 
 
 class LibDependency(Dependency):
+    __slots__ = ("libname",)
+
     def __init__(self, libname: str, origin: str) -> None:
         super().__init__(origin)
         self.libname = libname
@@ -23,6 +26,8 @@ class LibDependency(Dependency):
 
 
 class LocalBaseDependency(Dependency):
+    __slots__ = ("path",)
+
     def __init__(self, path: str, origin: str) -> None:
         super().__init__(origin)
         self.path = path
@@ -40,9 +45,11 @@ class LocalBaseDependency(Dependency):
 
 
 class PortDependency(Dependency):
+    __slots__ = ("pkgname", "condition")
+
     def __init__(self, pkgname: str, condition: str, origin: str) -> None:
         super().__init__(origin)
-        self.pkgname = pkgname
+        self.pkgname = intern(pkgname)
         self.condition = condition
 
     def __str__(self) -> str:
@@ -7,6 +7,8 @@ __all__ = ["Gnome", "PkgConfig", "ShebangFix"]
 def create_uses(name: str) -> type:
     @Uses.register(name)
     class UsesClass(Uses):
+        __slots__ = ()
+
         def __init__(self) -> None:
             super(UsesClass, self).__init__(name)
     return UsesClass
@@ -17,6 +19,8 @@ PkgConfig = create_uses("pkgconfig")
 
 @Uses.register("gnome")
 class Gnome(Uses):
+    __slots__ = ("components",)
+
     def __init__(self) -> None:
         super(Gnome, self).__init__("gnome")
         self.components: List[str] = []
@@ -31,6 +35,8 @@ class Gnome(Uses):
 
 @Uses.register("shebangfix")
 class ShebangFix(Uses):
+    __slots__ = ("files", "languages")
+
     def __init__(self) -> None:
         super(ShebangFix, self).__init__("shebangfix")
         self.files: List[str] = []
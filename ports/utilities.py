@@ -1,21 +1,61 @@
 from abc import ABCMeta, abstractproperty
-from typing import Any, Callable, Iterable, Iterator
+from itertools import islice
+from typing import Any, Callable, ClassVar, Dict, Generic, Iterable, Iterator, List, Tuple, TypeVar
 
-__all__ = ["Orderable", "Stream"]
+__all__ = ["LazyAttribute", "Orderable", "Stream"]
+
+T = TypeVar("T")  # pylint: disable=C0103
+
+
+class LazyAttribute(Generic[T]):
+    """
+    A class attribute that is computed on first access.
+
+    The decorated function is passed the owning class and its result replaces this descriptor on that class, so
+    subsequent accesses are plain attribute lookups.  Assigning to the attribute before first access overrides it, and
+    LazyAttribute.reset() restores the descriptor so that the attribute is computed again on next access.
+
+    Note that pylint infers the attribute to be this descriptor (and not its value), so operations such as membership
+    tests need to be disabled where used.
+    """
+    # pylint: disable=too-few-public-methods
+
+    _attributes: ClassVar[Dict[Tuple[type, str], "LazyAttribute[Any]"]] = {}
+
+    def __init__(self, func: Callable[[Any], T]) -> None:
+        self._func = func
+        self._name = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self._name = name
+        LazyAttribute._attributes[owner, name] = self
+
+    def __get__(self, instance: Any, owner: type) -> T:
+        value = self._func(owner)
+        setattr(owner, self._name, value)
+        return value
+
+    @staticmethod
+    def reset(owner: type, name: str) -> None:
+        """Discard the computed (or assigned) value of the named attribute of the class."""
+        setattr(owner, name, LazyAttribute._attributes[owner, name])
 
 
 class Orderable(object, metaclass=ABCMeta):
     # pylint: disable=too-few-public-methods
+    __slots__ = ()
+
     def __eq__(self, other: object) -> bool:
         assert isinstance(other, Orderable)
-        return bool(self._key() == other._key)  # pylint: disable=W0212
+        return bool(self._key == other._key)  # pylint: disable=W0212
 
     def __hash__(self) -> int:
         return hash(self._key)
 
     def __lt__(self, other: object) -> bool:
         assert isinstance(other, Orderable)
-        return bool(self._key() < other._key)  # pylint: disable=W0212
+        return bool(self._key < other._key)  # pylint: disable=W0212
 
     def __ne__(self, other: object) -> bool:
         """Determine if this object is not equal to the specified object."""
@@ -27,25 +67,36 @@ class Orderable(object, metaclass=ABCMeta):
 
 
 class Stream(Iterator[str]):
-    # pylint: disable=too-few-public-methods
+    """
+    A lazy, filtered iterator over lines (or other strings) that supports pushing back values.
+
+    The line counter starts at the specified line (with that many leading objects skipped) and is incremented for
+    each value taken, and decremented for each value pushed back.
+    """
+
     def __init__(self, objects: Iterable[str], filtr: Callable[[str], str] = lambda x: x, line: int = 1) -> None:
-        self._objects = list(objects)
+        self._objects = islice(objects, max(line, 0), None)
         self._filter = filtr
+        self._pushback: List[str] = []
         self.line = line
 
     def __iter__(self) -> Iterator[str]:
         return self
 
     def __next__(self) -> str:
-        if 0 <= self.line < len(self._objects):
-            self.line += 1
-            return self._filter(self._objects[self.line - 1])
-        raise StopIteration
+        value = self._pushback.pop() if self._pushback else self._filter(next(self._objects))
+        self.line += 1
+        return value
+
+    def push(self, value: str) -> None:
+        """Push back a value, so that it is the next value returned."""
+        self._pushback.append(value)
+        self.line -= 1
 
     def take_while(self, condition: Callable[[str], bool], inclusive: bool = False) -> Iterator[str]:
         for value in self:
             if not inclusive and not condition(value):
-                self.line -= 1
+                self.push(value)
                 break
             yield value
             if inclusive and not condition(value):
@@ -2,3 +2,6 @@
 
 pylint-3.6 -d missing-docstring,locally-disabled,import-error ports portcran.py
 mypy -i --strict --ignore-missing-imports ports portcran.py
+# importing the package must not touch the ports tree or fork make(1)
+PORTSDIR=/nonexistent MAKE=false python3 -c "import ports, ports.cran"
+python3 -m unittest discover -s test
@@ -0,0 +1,119 @@
+"""Tests of the parsing of CRAN package changelogs (ports.cran.changelog)."""
+from typing import Dict, Iterator, List, Optional
+from unittest import TestCase, main
+from ports.cran.changelog import parse_changelog
+
+
+class ChangelogTestCase(TestCase):
+    def setUp(self) -> None:
+        self.read: List[str] = []
+
+    def lines(self, text: str) -> Iterator[str]:
+        """Return the stripped lines of the text, recording which lines are read."""
+        for line in text.split("\n"):
+            self.read.append(line.strip())
+            yield line.strip()
+
+    def parse(self, text: str, version: str, versions: Optional[List[str]] = None) -> Dict[str, List[str]]:
+        return parse_changelog(self.lines(text), version, versions)
+
+
+class TestSections(ChangelogTestCase):
+    def test_unlabelled(self) -> None:
+        # entries before the first version identifier belong to the current version, which may be labelled later
+        changelog = self.parse("""\
+            * Fixed a bug.
+            * Added a feature.
+
+            Version 1.0
+            * Older change.
+
+            Version 1.2
+            * Labelled change.""", "1.2")
+        self.assertEqual(changelog, {
+            "1.2": ["Fixed a bug.", "Added a feature.", "Labelled change."],
+            "1.0": ["Older change."],
+        })
+
+    def test_first_label(self) -> None:
+        # a section for an unreleased version may precede the current version
+        changelog = self.parse("""\
+            Version 1.3
+            * Unreleased change.
+
+            Version 1.2
+            * Current change.
+
+            Version 1.1
+            * Old change.""", "1.2")
+        self.assertEqual(changelog, {"1.3": ["Unreleased change."], "1.2": ["Current change."]})
+        self.assertNotIn("* Old change.", self.read)
+
+    def test_missing(self) -> None:
+        changelog = self.parse("""\
+            Version 1.1
+            * Old change.""", "1.2")
+        self.assertEqual(changelog, {"1.1": ["Old change."]})
+
+    def test_ascending(self) -> None:
+        changelog = self.parse("""\
+            Version 1.0
+            * Initial release.
+            Version 1.2
+            * Current change.""", "1.2")
+        self.assertEqual(changelog, {"1.0": ["Initial release."], "1.2": ["Current change."]})
+
+    def test_versions(self) -> None:
+        text = """\
+            Changes to Version 1.2
+            * A
+            Changes to Version 1.1
+            * B
+            Changes to Version 1.0
+            * C"""
+        self.assertEqual(self.parse(text, "1.2"), {"1.2": ["A"]})
+        self.assertNotIn("* B", self.read)
+        self.assertEqual(self.parse(text, "1.2", ["1.2", "1.1"]), {"1.2": ["A"], "1.1": ["B"]})
+        self.assertNotIn("* C", self.read)
+
+
+class TestEntries(ChangelogTestCase):
+    def test_changelog(self) -> None:
+        changelog = self.parse("""\
+            2020-01-02  Jane Doe  <jane@example.org>
+
+            * DESCRIPTION: New version is 1.2.
+            * R/foo.R:
+            Fixed a bug.
+            * NAMESPACE: Export bar.
+
+            2019-01-01  Jane Doe  <jane@example.org>
+
+            * DESCRIPTION (Version): Version 1.1.
+            * R/bar.R: Old change.""", "1.2")
+        self.assertEqual(changelog, {"1.2": ["R/foo.R:Fixed a bug.", "NAMESPACE: Export bar."]})
+        self.assertNotIn("* R/bar.R: Old change.", self.read)
+
+    def test_continuation(self) -> None:
+        # lines that do not start an entry continue the previous entry, even after a blank line
+        changelog = self.parse("""\
+            Initial Version 1.2
+            o A change
+              spanning lines.
+            ( Another change.
+
+            continued.""", "1.2")
+        self.assertEqual(changelog, {"1.2": ["A change spanning lines.", "Another change. continued."]})
+
+    def test_leading_paragraph(self) -> None:
+        changelog = self.parse("""\
+            Version 1.2
+
+            A paragraph
+            continued.
+            * A change.""", "1.2")
+        self.assertEqual(changelog, {"1.2": ["A paragraph continued.", "A change."]})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Tests of fetching and verifying distfiles (ports.core.fetch), using a local HTTP server."""
+from contextlib import redirect_stdout
+from hashlib import md5, sha256
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Thread
+from typing import Any, List, Optional
+from unittest import TestCase, main
+from ports import PortError
+from ports.core.cache import Cache
+from ports.core.fetch import Checksums, fetch
+from ports.core.metrics import Metrics
+
+CONTENT = bytes(range(256)) * 1024
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serve CONTENT, honouring Range requests unless the server ignores them."""
+
+    server: "_Server"
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        byte_range = self.headers.get("Range")
+        self.server.ranges.append(byte_range)
+        offset = int(byte_range[len("bytes="):].rstrip("-")) if byte_range and self.server.ranges_supported else 0
+        if offset >= len(CONTENT):
+            self.send_response(416)
+            self.send_header("Content-Range", "bytes */%d" % len(CONTENT))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(206 if offset else 200)
+        if offset:
+            self.send_header("Content-Range", "bytes %d-%d/%d" % (offset, len(CONTENT) - 1, len(CONTENT)))
+        self.send_header("Content-Length", str(len(CONTENT) - offset))
+        self.end_headers()
+        self.wfile.write(CONTENT[offset:])
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+        pass
+
+
+class _Server(HTTPServer):
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.ranges: List[Optional[str]] = []
+        self.ranges_supported = True
+
+
+class TestFetch(TestCase):
+    def setUp(self) -> None:
+        self._tmpdir = TemporaryDirectory()
+        self.dir = Path(self._tmpdir.name)
+        self._cache_dir = Cache.dir
+        Cache.dir = self.dir / "cache"
+        Checksums.reset()
+        Metrics.drain()
+        self.server = _Server()
+        self._thread = Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.01})
+        self._thread.start()
+        self.url = "http://127.0.0.1:%d/pkg_1.0.tar.gz" % self.server.server_address[1]
+        self.distfile = self.dir / "distfiles" / "pkg_1.0.tar.gz"
+        self.partfile = self.distfile.with_name("pkg_1.0.tar.gz.part")
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self._thread.join()
+        self.server.server_close()
+        Cache.dir = self._cache_dir
+        Checksums.reset()
+        Metrics.drain()
+        self._tmpdir.cleanup()
+
+    def fetch(self, checksum: Optional[str] = None) -> Path:
+        with redirect_stdout(StringIO()):
+            return fetch(self.url, self.distfile, checksum)
+
+    def assertFetched(self) -> None:  # pylint: disable=invalid-name
+        self.assertEqual(self.distfile.read_bytes(), CONTENT)
+        self.assertFalse(self.partfile.exists())
+        Checksums.reset()
+        self.assertEqual(Checksums.recorded(self.distfile, "md5"), md5(CONTENT).hexdigest())
+        self.assertEqual(Checksums.recorded(self.distfile, "sha256"), sha256(CONTENT).hexdigest())
+
+    def write_partfile(self, data: bytes) -> None:
+        self.partfile.parent.mkdir(parents=True)
+        self.partfile.write_bytes(data)
+
+    def test_download(self) -> None:
+        self.assertEqual(self.fetch(md5(CONTENT).hexdigest()), self.distfile)
+        self.assertFetched()
+        self.assertEqual(self.server.ranges, [None])
+
+    def test_resume(self) -> None:
+        self.write_partfile(CONTENT[:1000])
+        self.fetch(md5(CONTENT).hexdigest())
+        self.assertFetched()
+        self.assertEqual(self.server.ranges, ["bytes=1000-"])
+        self.assertEqual(Metrics.drain()["http_bytes"], {"": len(CONTENT) - 1000})
+
+    def test_complete(self) -> None:
+        # the server responds 416 (range not satisfiable) as the partial download is already complete
+        self.write_partfile(CONTENT)
+        self.fetch(md5(CONTENT).hexdigest())
+        self.assertFetched()
+        self.assertEqual(self.server.ranges, ["bytes=%d-" % len(CONTENT)])
+
+    def test_range_ignored(self) -> None:
+        self.server.ranges_supported = False
+        self.write_partfile(CONTENT[:1000])
+        self.fetch(md5(CONTENT).hexdigest())
+        self.assertFetched()
+        self.assertEqual(self.server.ranges, ["bytes=1000-"])
+
+    def test_checksum_mismatch(self) -> None:
+        with self.assertRaises(PortError):
+            self.fetch(md5(b"other").hexdigest())
+        self.assertFalse(self.distfile.exists())
+        self.assertFalse(self.partfile.exists())
+
+    def test_corrupt_partfile(self) -> None:
+        # a corrupt partial download is retried once from the start
+        self.write_partfile(b"corrupt")
+        self.fetch(md5(CONTENT).hexdigest())
+        self.assertFetched()
+        self.assertEqual(self.server.ranges, ["bytes=7-", None])
+
+    def test_existing(self) -> None:
+        self.fetch(md5(CONTENT).hexdigest())
+        Checksums.reset()
+        Metrics.drain()
+        self.fetch(md5(CONTENT).hexdigest())
+        self.assertEqual(self.server.ranges, [None])
+        # the recorded checksum is used, as the distfile's size and modification time are unchanged
+        self.assertEqual(Metrics.drain(), {"cache_hits": {"distfiles": 1}})
+
+    def test_existing_changed(self) -> None:
+        self.fetch(md5(CONTENT).hexdigest())
+        self.distfile.write_bytes(CONTENT[:1000])
+        Checksums.reset()
+        self.fetch(md5(CONTENT).hexdigest())
+        self.assertFetched()
+        self.assertEqual(self.server.ranges, [None, None])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""Tests of the in-process evaluation of Makefiles (ports.core.make)."""
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from textwrap import dedent
+from unittest import TestCase, main
+from ports.core.make import MakeDict, load_makefile
+
+
+class MakefileTestCase(TestCase):
+    def setUp(self) -> None:
+        self._tmpdir = TemporaryDirectory()
+        self.dir = Path(self._tmpdir.name)
+
+    def tearDown(self) -> None:
+        self._tmpdir.cleanup()
+
+    def write(self, name: str, text: str) -> Path:
+        path = self.dir / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(dedent(text))
+        return path
+
+    def load(self, text: str) -> MakeDict:
+        makefile = self.write("Makefile", text)
+        return load_makefile(makefile, MakeDict({".CURDIR": str(self.dir)}))
+
+
+class TestAssignment(MakefileTestCase):
+    def test_operators(self) -> None:
+        variables = self.load("""\
+            A=	one
+            A+=	two
+            B?=	three
+            B?=	four
+            C=	${A}
+            D:=	${A} ${UNDEFINED}
+            A+=	five
+            """)
+        self.assertEqual(variables.evaluate("A"), ["one", "two", "five"])
+        self.assertEqual(variables.evaluate("B"), ["three"])
+        self.assertEqual(variables.evaluate("C"), ["one", "two", "five"])
+        self.assertEqual(variables["D"], ["one", "two", "${UNDEFINED}"])
+
+    def test_unexpanded_words(self) -> None:
+        variables = self.load("""\
+            PORTNAME=	foo
+            DISTVERSION=	1.0
+            DISTNAME=	${PORTNAME}_${DISTVERSION}
+            NAME=	${PORTNAME}
+            """)
+        self.assertEqual(variables["DISTNAME"], ["${PORTNAME}_${DISTVERSION}"])
+        self.assertEqual(variables["NAME"], ["foo"])
+        self.assertEqual(variables.evaluate("DISTNAME"), ["foo_1.0"])
+
+    def test_self_reference(self) -> None:
+        variables = self.load("""\
+            A=	${B}
+            B=	${A}
+            """)
+        with self.assertRaises(ValueError):
+            variables.evaluate("A")
+
+    def test_targets(self) -> None:
+        variables = self.load("""\
+            A=	one
+            post-install:
+            \tB=	not an assignment
+            C=	two
+            """)
+        self.assertEqual(list(variables.variables), ["A", "C"])
+
+
+class TestModifiers(TestCase):
+    def setUp(self) -> None:
+        self.variables = MakeDict()
+        self.variables.set("FILES", ["src/a.c", "src/b.h", "c.c", "src/a.c"])
+        self.variables.set("NAME", ["Foo"])
+
+    def expand(self, text: str) -> str:
+        return self.variables.expand(text)
+
+    def test_match(self) -> None:
+        self.assertEqual(self.expand("${FILES:M*.c}"), "src/a.c c.c src/a.c")
+        self.assertEqual(self.expand("${FILES:N*.c}"), "src/b.h")
+
+    def test_substitute(self) -> None:
+        self.assertEqual(self.expand("${FILES:S/src/lib/}"), "lib/a.c lib/b.h c.c lib/a.c")
+        self.assertEqual(self.expand("${FILES:C/^src\\///}"), "a.c b.h c.c a.c")
+        self.assertEqual(self.expand("${FILES:.c=.o}"), "src/a.o src/b.h c.o src/a.o")
+        self.assertEqual(self.expand("${FILES:src/%.c=%.o}"), "a.o src/b.h c.c a.o")
+
+    def test_case(self) -> None:
+        self.assertEqual(self.expand("${NAME:tl}"), "foo")
+        self.assertEqual(self.expand("${NAME:tu}"), "FOO")
+
+    def test_path(self) -> None:
+        self.assertEqual(self.expand("${FILES:H}"), "src src . src")
+        self.assertEqual(self.expand("${FILES:T}"), "a.c b.h c.c a.c")
+        self.assertEqual(self.expand("${FILES:E}"), "c h c c")
+        self.assertEqual(self.expand("${FILES:R}"), "src/a src/b c src/a")
+
+    def test_order(self) -> None:
+        self.assertEqual(self.expand("${FILES:O}"), "c.c src/a.c src/a.c src/b.h")
+        self.assertEqual(self.expand("${FILES:O:u}"), "c.c src/a.c src/b.h")
+
+    def test_defined(self) -> None:
+        self.assertEqual(self.expand("${NAME:Ddefined}"), "defined")
+        self.assertEqual(self.expand("${UNDEFINED:Ddefined}"), "")
+        self.assertEqual(self.expand("${UNDEFINED:Udefault}"), "default")
+        self.assertEqual(self.expand("${NAME:Udefault}"), "Foo")
+        self.assertEqual(self.expand("${NAME:L}"), "NAME")
+
+    def test_chained(self) -> None:
+        self.assertEqual(self.expand("${FILES:M*.c:T:R:O:u:tu}"), "A C")
+
+
+class TestMemo(TestCase):
+    """The memoised values of variables are discarded when a variable they (indirectly) reference changes."""
+
+    def setUp(self) -> None:
+        self.variables = MakeDict()
+        self.variables.set("A", ["a", "${B}"])
+        self.variables.set("B", ["${C}", "b"])
+        self.variables.set("C", ["c"])
+        self.variables.set("D", ["${C}"])
+        self.assertEqual(self.variables["A"], ["a", "c", "b"])
+        self.assertEqual(self.variables["D"], ["c"])
+
+    def test_set(self) -> None:
+        self.variables.set("C", ["x", "y"])
+        self.assertEqual(self.variables["A"], ["a", "x", "y", "b"])
+        self.assertEqual(self.variables["B"], ["x", "y", "b"])
+        self.assertEqual(self.variables["D"], ["x", "y"])
+        self.variables.set("B", ["z"])
+        self.assertEqual(self.variables["A"], ["a", "z"])
+        self.assertEqual(self.variables["D"], ["x", "y"])
+
+    def test_extend(self) -> None:
+        self.variables.extend("C", ["x"])
+        self.assertEqual(self.variables["A"], ["a", "c", "x", "b"])
+        self.assertEqual(self.variables["D"], ["c", "x"])
+
+    def test_add(self) -> None:
+        self.variables.add("C", ["x"])
+        self.assertEqual(self.variables["A"], ["a", "c", "b"])
+        self.variables.set("E", ["${F}"])
+        self.assertEqual(self.variables["E"], ["${F}"])
+        self.variables.add("F", ["f"])
+        self.assertEqual(self.variables["E"], ["f"])
+
+    def test_pop(self) -> None:
+        self.assertEqual(self.variables.pop("C"), ["c"])
+        self.assertEqual(self.variables["A"], ["a", "${C}", "b"])
+        self.assertEqual(self.variables["D"], ["${C}"])
+        self.variables.set("C", ["x"])
+        self.assertEqual(self.variables["A"], ["a", "x", "b"])
+        self.assertEqual(self.variables.pop("A"), ["a", "x", "b"])
+        self.variables.set("C", ["y"])
+        self.assertEqual(self.variables["B"], ["y", "b"])
+        self.assertNotIn("A", self.variables)
+
+
+class TestConditionals(MakefileTestCase):
+    def test_branches(self) -> None:
+        variables = self.load("""\
+            A=	yes
+            .if defined(A) && !defined(B)
+            R1=	if
+            .elif defined(A)
+            R1=	elif
+            .else
+            R1=	else
+            .endif
+            .ifdef B
+            R2=	ifdef
+            .elifndef C
+            R2=	elifndef
+            .endif
+            .if empty(B) || ${A} == "no"
+            R3=	empty
+            .endif
+            .if !(${A:tu} == YES)
+            R4=	not
+            .else
+            .  if 1
+            R4=	nested
+            .  endif
+            .endif
+            """)
+        self.assertEqual(variables["R1"], ["if"])
+        self.assertEqual(variables["R2"], ["elifndef"])
+        self.assertEqual(variables["R3"], ["empty"])
+        self.assertEqual(variables["R4"], ["nested"])
+
+    def test_numeric(self) -> None:
+        variables = self.load("""\
+            VERSION=	1300000
+            .if ${VERSION} >= 1200000 && ${VERSION} < 0x2000000
+            NEW=	yes
+            .endif
+            """)
+        self.assertEqual(variables["NEW"], ["yes"])
+
+    def test_framework_variables(self) -> None:
+        # OSVERSION, ARCH and OPSYS are defined by the (unevaluated) system includes
+        variables = self.load("""\
+            .if ${OSVERSION} < 1200000
+            OLD=	yes
+            .endif
+            .if ${ARCH} == amd64 || ${OPSYS} == FreeBSD
+            AMD64=	yes
+            .endif
+            .include <bsd.port.mk>
+            """)
+        self.assertNotIn("OLD", variables)
+        self.assertNotIn("AMD64", variables)
+
+    def test_malformed(self) -> None:
+        with self.assertRaises(ValueError):
+            self.load("""\
+                .if defined(A)
+                A=	yes
+                """)
+        with self.assertRaises(ValueError):
+            self.load("""\
+                .if (defined(A)
+                .endif
+                """)
+        with self.assertRaises(ValueError):
+            self.load(""".error failed""")
+
+    def test_undef(self) -> None:
+        variables = self.load("""\
+            A=	yes
+            .undef A
+            """)
+        self.assertNotIn("A", variables)
+
+
+class TestFor(MakefileTestCase):
+    def test_loop(self) -> None:
+        variables = self.load("""\
+            FLAVORS=	a b
+            .for f in ${FLAVORS}
+            PKG_${f:tu}=	pkg-${f}
+            ALL+=	${f}
+            .  if ${f} == b
+            B=	${f}
+            .  endif
+            .endfor
+            """)
+        self.assertEqual(variables["PKG_A"], ["pkg-a"])
+        self.assertEqual(variables["PKG_B"], ["pkg-b"])
+        self.assertEqual(variables["ALL"], ["a", "b"])
+        self.assertEqual(variables["B"], ["b"])
+
+    def test_pairs_and_nesting(self) -> None:
+        variables = self.load("""\
+            .for k v in x 1 y 2
+            .  for s in - +
+            PAIRS+=	${k}${s}${v}
+            .  endfor
+            .endfor
+            """)
+        self.assertEqual(variables["PAIRS"], ["x-1", "x+1", "y-2", "y+2"])
+
+    def test_inactive(self) -> None:
+        variables = self.load("""\
+            .if defined(UNDEFINED)
+            .for f in a b
+            LOOP+=	${f}
+            .endfor
+            .endif
+            """)
+        self.assertNotIn("LOOP", variables)
+
+    def test_unterminated(self) -> None:
+        with self.assertRaises(ValueError):
+            self.load("""\
+                .for f in a b
+                LOOP+=	${f}
+                """)
+
+
+class TestInclude(MakefileTestCase):
+    def test_include(self) -> None:
+        self.write("Makefile.inc", """\
+            INCLUDED:=	${.PARSEDIR:T}
+            """)
+        self.write("sub/Makefile.common", """\
+            COMMON=	yes
+            """)
+        variables = self.load("""\
+            .include "Makefile.inc"
+            .include "${.CURDIR}/sub/Makefile.common"
+            .sinclude "missing.mk"
+            .include <bsd.port.mk>
+            """)
+        self.assertEqual(variables.evaluate("INCLUDED"), [self.dir.name])
+        self.assertEqual(variables["COMMON"], ["yes"])
+
+    def test_system_include(self) -> None:
+        self.write("Mk/bsd.port.mk", """\
+            SYSTEM=	yes
+            """)
+        makefile = self.write("Makefile", """\
+            .include <bsd.port.mk>
+            """)
+        variables = load_makefile(makefile, MakeDict({".CURDIR": str(self.dir)}), [self.dir / "Mk"])
+        self.assertEqual(variables["SYSTEM"], ["yes"])
+
+    def test_missing(self) -> None:
+        with self.assertRaises(ValueError):
+            self.load(""".include "missing.mk\"""")
+
+
+if __name__ == "__main__":
+    main()
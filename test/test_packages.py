@@ -0,0 +1,111 @@
+"""Tests of the CRAN PACKAGES index (ports.cran.packages)."""
+from gzip import compress
+from os import environ, utime
+from pathlib import Path
+from subprocess import check_output
+from sys import executable
+from tempfile import TemporaryDirectory
+from textwrap import dedent
+from time import time
+from unittest import TestCase, main
+from ports import PortError
+from ports.core.metrics import Metrics
+from ports.cran.packages import Package, Packages, parse_packages
+
+PACKAGES = dedent("""\
+    Package: foo
+    Version: 1.2-3
+    Depends: R (>= 3.0), bar
+    Imports: baz (>= 0.1),
+            qux
+    License: GPL-2
+    MD5sum: 0123456789abcdef0123456789abcdef
+    NeedsCompilation: no
+
+    Package: bar
+    Version: 0.1
+    """)
+
+
+class TestParsePackages(TestCase):
+    def test_records(self) -> None:
+        packages = parse_packages(PACKAGES.splitlines())
+        self.assertEqual(list(packages), ["foo", "bar"])
+        self.assertEqual(packages["foo"], Package(
+            name="foo",
+            version="1.2-3",
+            depends="R (>= 3.0), bar",
+            imports="baz (>= 0.1), qux",
+            md5sum="0123456789abcdef0123456789abcdef",
+            needs_compilation="no",
+        ))
+        self.assertEqual(packages["bar"], Package(name="bar", version="0.1"))
+
+    def test_requires(self) -> None:
+        packages = parse_packages(PACKAGES.splitlines())
+        self.assertEqual(packages["foo"].requires, ["R", "bar", "baz", "qux"])
+        self.assertEqual(packages["bar"].requires, [])
+
+    def test_blank_lines(self) -> None:
+        packages = parse_packages(["", "Package: foo", "Version: 1.0", "", "", "Version: 2.0", ""])
+        self.assertEqual(packages, {"foo": Package(name="foo", version="1.0")})
+
+
+class TestLocalIndex(TestCase):
+    def setUp(self) -> None:
+        self._tmpdir = TemporaryDirectory()
+        self.dir = Path(self._tmpdir.name)
+        self._index = Packages.index
+        Packages.reset()
+        Metrics.drain()
+
+    def tearDown(self) -> None:
+        Packages.index = self._index
+        Packages.reset()
+        Metrics.drain()
+        self._tmpdir.cleanup()
+
+    def check(self) -> None:
+        self.assertEqual(Packages.get("foo").version, "1.2-3")
+        self.assertEqual(Packages.get("bar").version, "0.1")
+        with self.assertRaises(PortError):
+            Packages.get("missing")
+        # a local index is read directly, without a request or the cache
+        self.assertEqual(Metrics.drain(), {})
+
+    def test_plain(self) -> None:
+        index = self.dir / "PACKAGES"
+        index.write_text(PACKAGES)
+        Packages.index = str(index)
+        self.check()
+
+    def test_environment(self) -> None:
+        index = self.dir / "PACKAGES"
+        index.write_text(PACKAGES)
+        script = "from ports.cran import Packages; print(Packages.index, Packages.get('foo').version)"
+        environment = dict(environ, CRAN_PACKAGES=str(index))
+        output = check_output([executable, "-c", script], env=environment, cwd=str(Path(__file__).parents[1]))
+        self.assertEqual(output.decode("utf-8").split(), [str(index), "1.2-3"])
+
+    def test_gzip(self) -> None:
+        index = self.dir / "PACKAGES.gz"
+        index.write_bytes(compress(PACKAGES.encode("utf-8")))
+        Packages.index = index.as_uri()
+        self.check()
+
+    def test_refresh(self) -> None:
+        index = self.dir / "PACKAGES"
+        index.write_text(PACKAGES)
+        utime(str(index), (time() - 60, time() - 60))
+        Packages.index = str(index)
+        self.assertEqual(Packages.get("bar").version, "0.1")
+        Packages.refresh()
+        self.assertEqual(Packages.get("bar").version, "0.1")
+        index.write_text(PACKAGES.replace("Version: 0.1", "Version: 0.2"))
+        utime(str(index), (time() + 60, time() + 60))
+        Packages.refresh()
+        self.assertEqual(Packages.get("bar").version, "0.2")
+
+
+if __name__ == "__main__":
+    main()
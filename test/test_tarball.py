@@ -0,0 +1,70 @@
+"""Tests of the single pass extraction of members from CRAN tarballs (ports.cran.tarball)."""
+from io import BytesIO
+from pathlib import Path
+from tarfile import TarFile, TarInfo
+from tempfile import TemporaryDirectory
+from typing import List
+from unittest import TestCase, main
+from ports.cran.tarball import Tarball
+
+
+class TestTarball(TestCase):
+    def setUp(self) -> None:
+        self._tmpdir = TemporaryDirectory()
+        self.dir = Path(self._tmpdir.name)
+
+    def tearDown(self) -> None:
+        self._tmpdir.cleanup()
+
+    def tarball(self, names: List[str]) -> Path:
+        path = self.dir / "pkg_1.0.tar.gz"
+        with TarFile.open(str(path), "w:gz") as tar_file:
+            for name in names:
+                data = ("contents of %s\n" % name).encode("utf-8")
+                info = TarInfo(name)
+                info.size = len(data)
+                tar_file.addfile(info, BytesIO(data))
+        return path
+
+    def test_members(self) -> None:
+        path = self.tarball(["pkg/DESCRIPTION", "pkg/NEWS", "pkg/R/a.R"])
+        with Tarball(path, ["pkg/DESCRIPTION"], ["pkg/NEWS", "pkg/ChangeLog"]) as tarball:
+            self.assertEqual(tarball.extractfile("pkg/DESCRIPTION").read(), b"contents of pkg/DESCRIPTION\n")
+            self.assertEqual(tarball.extractfile("pkg/NEWS").read(), b"contents of pkg/NEWS\n")
+            with self.assertRaises(KeyError):
+                tarball.extractfile("pkg/ChangeLog")
+            with self.assertRaises(KeyError):
+                tarball.extractfile("pkg/R/a.R")
+
+    def test_unsorted(self) -> None:
+        # GNU tar writes the members in directory order, which need not be sorted
+        path = self.tarball(["pkg/DESCRIPTION", "pkg/R/a.R", "pkg/NEWS"])
+        with Tarball(path, ["pkg/DESCRIPTION"], ["pkg/NEWS"]) as tarball:
+            self.assertEqual(tarball.extractfile("pkg/NEWS").read(), b"contents of pkg/NEWS\n")
+
+    def test_stops_early(self) -> None:
+        path = self.tarball(["pkg/DESCRIPTION", "pkg/NEWS"] + ["pkg/R/%d.R" % i for i in range(100)])
+        with Tarball(path, ["pkg/DESCRIPTION"], ["pkg/NEWS"]) as tarball:
+            self.assertLess(tarball.bytes_decompressed, 100 * 512)
+
+    def test_news_only(self) -> None:
+        # most packages have only one of the alternatives, which is enough to stop
+        path = self.tarball(["pkg/NEWS", "pkg/DESCRIPTION"] + ["pkg/R/%d.R" % i for i in range(100)])
+        with Tarball(path, ["pkg/DESCRIPTION"], ["pkg/ChangeLog", "pkg/NEWS"]) as tarball:
+            self.assertEqual(tarball.extractfile("pkg/NEWS").read(), b"contents of pkg/NEWS\n")
+            self.assertLess(tarball.bytes_decompressed, 100 * 512)
+
+    def test_alternative_order(self) -> None:
+        # a less preferred alternative that precedes the preferred alternative is used instead
+        path = self.tarball(["pkg/DESCRIPTION", "pkg/NEWS", "pkg/ChangeLog"])
+        with Tarball(path, ["pkg/DESCRIPTION"], ["pkg/ChangeLog", "pkg/NEWS"]) as tarball:
+            self.assertEqual(tarball.extractfile("pkg/NEWS").read(), b"contents of pkg/NEWS\n")
+            with self.assertRaises(KeyError):
+                tarball.extractfile("pkg/ChangeLog")
+        path = self.tarball(["pkg/ChangeLog", "pkg/NEWS", "pkg/DESCRIPTION"])
+        with Tarball(path, ["pkg/DESCRIPTION"], ["pkg/ChangeLog", "pkg/NEWS"]) as tarball:
+            self.assertEqual(tarball.extractfile("pkg/ChangeLog").read(), b"contents of pkg/ChangeLog\n")
+
+
+if __name__ == "__main__":
+    main()